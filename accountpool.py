@@ -0,0 +1,192 @@
+"""
+Spreading the LMS requests over several HSE accounts
+"""
+from contextlib import contextmanager
+from functools import partial
+from typing import Awaitable, Callable, Iterator
+from time import monotonic
+from auth import LMSAuther, AuthError, CredentialsRejectedError
+from lmshttp import CircuitBreakers, LatencyStats, LMSSession
+from model import Token
+from tokenmanager import TokenManager
+import logging
+import settings
+
+
+logger = logging.getLogger("account_pool")
+logger.setLevel(settings.LOG_LEVEL)
+
+
+def load_credentials(path: str = "AUTH_CREDENTIALS") -> list[tuple[str, str]]:
+    """
+    The file has a username line followed by a password line for every account,
+    blank lines are skipped
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    if len(lines) == 0 or len(lines) % 2 != 0:
+        raise ValueError(f"{path} should have a username and a password line for every account")
+
+    return list(zip(lines[::2], lines[1::2]))
+
+
+class LMSAccount:
+    """
+    One HSE account with its own session (and cookies) and its own tokens
+    """
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        load: Callable[[str, str], Awaitable[Token | None]],
+        store: Callable[[str, Token], Awaitable[None]],
+        latency_stats: LatencyStats | None = None,
+        circuit_breakers: CircuitBreakers | None = None,
+    ):
+        self.username = username
+        self.password = password
+        self.session = LMSSession(latency_stats, circuit_breakers)
+        # the tokens are stored under the username
+        self.token_manager = TokenManager(partial(load, username), partial(store, username))
+        self.token_manager.register("MSISAuth", self.__get_msis_from_auth)
+        self.token_manager.register("Bearer", self.__refresh_bearer)
+        # sections being synced with this account right now
+        self.in_flight = 0
+        # whether the last auth attempt failed because the auth server rejected the credentials,
+        # as opposed to not being reachable
+        self.credentials_rejected = False
+        # not used until then after its credentials are rejected
+        self.disabled_until = 0.0
+
+    async def __get_msis_from_auth(self) -> Token | None:
+        func = partial(LMSAuther.get_msisauth_token, username=self.username, password=self.password)
+        # a stale ADFS session in the cookie jar could skip the login form
+        self.session.clear_cookies()
+
+        return await self.__call_from_auth(func)
+
+    async def __get_bearer_from_auth(self, msis: Token) -> Token | None:
+        func = partial(LMSAuther.get_bearer_token, msisauth_token=msis)
+
+        return await self.__call_from_auth(func)
+
+    async def __call_from_auth(self, func: partial):
+        auther = LMSAuther(self.session.client)
+        self.credentials_rejected = False
+
+        try:
+            return await func(self=auther)
+        except CredentialsRejectedError as e:
+            logger.warning(f"Credentials of {self.username} were rejected: {e}")
+            self.credentials_rejected = True
+            return None
+        except AuthError as e:
+            logger.warning(f"Auth failed for {self.username}: {e}")
+            return None
+
+    async def __refresh_bearer(self) -> Token | None:
+        msis = await self.get_msis()
+
+        if msis is None:
+            return None
+
+        return await self.__get_bearer_from_auth(msis)
+
+    async def get_msis(self) -> Token | None:
+        logger.info(f"Getting MSISAuth token for {self.username}.")
+        msis = await self.token_manager.get("MSISAuth")
+
+        if msis is None:
+            logger.warning(f"Could not get MSISAuth token for {self.username}")
+
+        return msis
+
+    async def get_bearer(self) -> Token | None:
+        logger.info(f"Getting Bearer token for {self.username}.")
+        bearer = await self.token_manager.get("Bearer")
+
+        if bearer is None:
+            logger.warning(f"Could not get Bearer token for {self.username}")
+
+        return bearer
+
+    def is_available(self, now: float) -> bool:
+        return self.disabled_until <= now
+
+    async def close(self):
+        self.token_manager.close()
+        await self.session.aclose()
+
+
+class AccountPool:
+    """
+    Hands out the least loaded account, ties are broken round-robin.
+    Accounts whose credentials are rejected are skipped for disable_seconds
+    """
+    def __init__(
+        self,
+        accounts: list[LMSAccount],
+        disable_seconds: float = settings.ACCOUNT_DISABLE_SECONDS
+    ):
+        if len(accounts) == 0:
+            raise ValueError("The account pool needs at least one account")
+
+        self.accounts = accounts
+        self.disable_seconds = disable_seconds
+        self.__next_index = 0
+
+    def candidates(self) -> Iterator[LMSAccount]:
+        """
+        The available accounts in the order they should be tried in,
+        each one is picked only when the previous one has failed so the loads are up to date
+        """
+        tried: set[int] = set()
+
+        while True:
+            now = monotonic()
+            remaining = [
+                index for index, account in enumerate(self.accounts)
+                if index not in tried and account.is_available(now)
+            ]
+
+            if not remaining:
+                return
+
+            index = min(
+                remaining,
+                key=lambda index: (
+                    self.accounts[index].in_flight,
+                    (index - self.__next_index) % len(self.accounts)
+                )
+            )
+            tried.add(index)
+            self.__next_index = (index + 1) % len(self.accounts)
+
+            yield self.accounts[index]
+
+    @contextmanager
+    def use(self, account: LMSAccount):
+        account.in_flight += 1
+
+        try:
+            yield account
+        finally:
+            account.in_flight -= 1
+
+    def disable(self, account: LMSAccount):
+        logger.warning(f"Not using account {account.username} for {self.disable_seconds:.0f} s.")
+        account.disabled_until = monotonic() + self.disable_seconds
+
+    def summary(self) -> str:
+        now = monotonic()
+
+        return ", ".join(
+            f"{account.username}: "
+            + ("ok" if account.is_available(now) else f"disabled for {account.disabled_until - now:.0f} s")
+            for account in self.accounts
+        )
+
+    async def close(self):
+        for account in self.accounts:
+            await account.close()
@@ -1,10 +1,56 @@
-import time
-import taskservice
+from taskservice import LMSTaskService
+from accountpool import load_credentials
+from bot import BotService
+from supervisor import Supervisor
+from eventbus import EventBus
+from model import TaskSyncResult
 import sys
 import settings
-import bot
 import logging
-import threading
+import signal
+import asyncio
+import aiosqlite
+
+
+async def run_app():
+    with open("API_TOKEN", "r", encoding="utf-8") as f:
+        api_token = f.read().strip()
+    
+    credentials = load_credentials()
+    
+    # one connection for everything, so the services don't fight over the db write lock
+    async with aiosqlite.connect(settings.DB_PATH) as connection:
+        # the sync results go straight to the bot's reminder schedule
+        task_events: EventBus[TaskSyncResult] = EventBus()
+        task_service = LMSTaskService(connection, credentials, task_events)
+        bot_service = BotService(connection, api_token, task_events)
+        
+        supervisor = Supervisor()
+        supervisor.add("task service", task_service.run)
+        # the loop is shared now, so this measures how much anything blocks it
+        supervisor.add("loop lag monitor", task_service.loop_lag.run)
+        supervisor.add("bot updates", bot_service.run_updates)
+        supervisor.add("reminders", bot_service.run_reminders)
+        supervisor.add("task events", bot_service.run_task_events)
+        supervisor.add("reminded time flush", bot_service.reminded_time_buffer.run_periodic_flush)
+        supervisor.add("outbox", bot_service.outbox.run)
+        
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, supervisor.stop)
+            except NotImplementedError:
+                # windows, ctrl+c still stops asyncio.run with a KeyboardInterrupt
+                pass
+        
+        try:
+            await supervisor.run()
+        finally:
+            logging.info("Shutting down")
+            try:
+                await bot_service.close()
+            finally:
+                await task_service.close()
 
 
 def main():
@@ -23,19 +69,9 @@ def main():
     
     logging.info("Application started")
     
-    logging.info("Starting task service")
-    task_service_thread = threading.Thread(target=taskservice.task_service_worker, daemon=True)
-    task_service_thread.start()
-    
-    logging.info("Starting bot service")
-    bot_service_thread = threading.Thread(target=bot.bot_worker, daemon=True)
-    bot_service_thread.start()
-    
-    while task_service_thread.is_alive() and bot_service_thread.is_alive():
-        time.sleep(settings.LOOP_SLEEP_TIME)
+    asyncio.run(run_app())
     
-    logging.error("Critical error: one of the threads died")
-    logging.info("Trying to shut down")
+    logging.info("Application stopped")
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,7 +4,7 @@ Getting the auth tokens for HSE authorization
 import httpx
 import asyncio
 from model import Token
-import dateparser
+from deadlineparser import parse_cookie_date
 from datetime import datetime, timedelta
 import urllib.parse
 from bs4 import BeautifulSoup
@@ -15,6 +15,12 @@ class AuthError(Exception):
     """
     pass
 
+class CredentialsRejectedError(AuthError):
+    """
+    The login went through but didn't give a session, i.e. a wrong password or a locked account
+    """
+    pass
+
 class LMSAuther:
     # idk if client id ever changes
     FORM_URL = "https://auth.hse.ru/adfs/oauth2/authorize?client_id=4403a646-2af8-42ba-a2b1-4f5a50a5b376&redirect_uri=https://smartedu.hse.ru/auth&response_type=token&response_mode=fragment"
@@ -67,6 +73,11 @@ class LMSAuther:
         except httpx.HTTPError as e:
             raise AuthError(f"{e}")
 
+        # an overloaded or failing auth server doesn't mean the credentials are wrong.
+        # not raise_for_status, a successful login is answered with a redirect
+        if response.is_error:
+            raise AuthError(f"Unexpected response status code: {response.status_code}")
+
         return response
 
     @staticmethod
@@ -75,7 +86,7 @@ class LMSAuther:
         set_cookie_header: str | None = response.headers.get("set-cookie")
 
         if set_cookie_header is None:
-            raise AuthError("set-cookie header not found")
+            raise CredentialsRejectedError("set-cookie header not found")
 
         cookie_data_list: list[tuple[str, str]] = [
             # gets cookie value and expiration date
@@ -91,14 +102,18 @@ class LMSAuther:
         value = cookie_data.get(title)
 
         if value is None:
-            raise AuthError("Couldn't get the bearer token value")
+            raise CredentialsRejectedError("Couldn't get the MSISAuth token value")
 
         # setting default to "" so we don't have to make another None check
-        expires = dateparser.parse(cookie_data.get("expires", ""))
+        expires = parse_cookie_date(cookie_data.get("expires", ""))
 
         if expires is None:
             raise AuthError("Couldn't get token expiration date")
 
+        # the cookie date is in GMT, the other tokens' dates are naive local time
+        if expires.tzinfo is not None:
+            expires = expires.astimezone().replace(tzinfo=None)
+
         return Token(title=title, value=value, expiration_dt=expires)
     
     async def get_bearer_token(self, msisauth_token: Token) -> Token:
@@ -150,8 +165,10 @@ class LMSAuther:
 
 
 async def main():
-    with open("AUTH_CREDENTIALS", "r") as f:
-        username, password = (s.strip() for s in f.readlines())
+    from accountpool import load_credentials
+    
+    # the first account is enough here
+    username, password = load_credentials()[0]
 
     async with httpx.AsyncClient() as client:
         auther = LMSAuther(client)
@@ -1,12 +1,19 @@
 from datetime import datetime, timedelta
 from pprint import pformat
+import itertools
 import time
 from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
+from aiogram.dispatcher.webhook import configure_app
 from aiogram.utils import exceptions
+from aiohttp import web
 import pytz
-from model import ReminderInlineQueryData, Task, TaskType, User
+from model import ReminderInlineQueryData, Task, TaskSyncResult, TaskType, User
+from eventbus import EventBus
 from userservice import UserService
-from remindservice import RemindService
+from remindservice import RemindService, RemindedTimeBuffer
+from remindscheduler import RemindScheduler
+from outbox import Outbox, OutgoingMessage
 # import sqlite3
 import aiosqlite
 import asyncio
@@ -14,16 +21,31 @@ import settings
 import bot_messages
 import logging
 import pytimeparse
+import secrets
 
 logger = logging.getLogger("bot")
 logger.setLevel(settings.LOG_LEVEL)
 
+# Telegram sends the secret given to set_webhook in this header with every update
+WEBHOOK_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
 class BotService:
-    def __init__(self, connection: aiosqlite.Connection, api_token: str):
+    def __init__(
+        self, 
+        connection: aiosqlite.Connection, 
+        api_token: str, 
+        task_events: EventBus[TaskSyncResult] | None = None,
+        api_server: TelegramAPIServer = TELEGRAM_PRODUCTION
+    ):
         self.user_service = UserService(connection)
         self.remind_service = RemindService(connection)
-        self.bot = Bot(api_token)
+        self.reminded_time_buffer = RemindedTimeBuffer(self.remind_service)
+        self.scheduler = RemindScheduler()
+        self.bot = Bot(api_token, server=api_server)
+        self.outbox = Outbox(self.bot)
         self.dispatcher = Dispatcher(self.bot)
+        # subscribing right away so that no sync results are missed before run_task_events starts
+        self.task_events = task_events.subscribe("bot") if task_events is not None else None
         
         self.create_handlers()
         
@@ -44,6 +66,7 @@ class BotService:
             if user is None:
                 logger.info("user not found, registering...")
                 user = await self.user_service.register_new_user(user_id)
+                await self.schedule_user(user)
                 await message.answer(bot_messages.GREETING, settings.BOT_MESSAGE_PARSE_MODE)
                 return
             
@@ -62,6 +85,7 @@ class BotService:
                 await message.answer(bot_messages.ERROR, settings.BOT_MESSAGE_PARSE_MODE)
                 return
             
+            await self.schedule_user(user)
             await message.answer(bot_messages.REMINDERS_TURNED_FMT.format("on"))
         
         @self.dispatcher.message_handler(commands=("stop",))
@@ -86,6 +110,7 @@ class BotService:
                 await message.answer(bot_messages.ERROR, settings.BOT_MESSAGE_PARSE_MODE)
                 return
             
+            self.scheduler.remove_user(user.user_id)
             await message.answer(bot_messages.REMINDERS_TURNED_FMT.format("off"))
         
         @self.dispatcher.message_handler(commands=("set_remind_interval",))
@@ -129,7 +154,111 @@ class BotService:
                 await message.answer(bot_messages.ERROR)
                 return
             
+            self.scheduler.update_user(user)
             await message.answer(bot_messages.INTERVAL_CHANGED_FMT.format(str(interval)))
+        
+        @self.dispatcher.message_handler(commands=("digest",))
+        async def digest(message: types.Message):
+            logger.info(f"User {message.from_id} ({message.from_user.full_name} @{message.from_user.username}) used /digest")
+            user = await self.user_service.get_or_register_user(message.from_id)
+            
+            args = (message.get_args() or "").strip().lower()
+            logger.info(f"{args=}")
+            
+            if args not in ("", "on", "off"):
+                logger.info("Invalid args")
+                await message.answer(bot_messages.DIGEST_INVALID_ARGS)
+                return
+            
+            digest_mode = args != "off"
+            state = "on" if digest_mode else "off"
+            
+            if user.digest_mode == digest_mode:
+                logger.info(f"Digest mode is already {state}")
+                await message.answer(bot_messages.DIGEST_ALREADY_FMT.format(state))
+                return
+            
+            logger.info(f"Turning digest mode {state}")
+            user.digest_mode = digest_mode
+            try:
+                await self.user_service.update_user(user)
+            except Exception as e:
+                logger.exception(e)
+                await message.answer(bot_messages.ERROR)
+                return
+            
+            self.scheduler.update_user(user)
+            await message.answer(bot_messages.DIGEST_TURNED_FMT.format(state))
+        
+        @self.dispatcher.message_handler(commands=("sections",))
+        async def sections(message: types.Message):
+            logger.info(f"User {message.from_id} ({message.from_user.full_name} @{message.from_user.username}) used /sections")
+            
+            subscriptions = await self.user_service.get_subscriptions(message.from_id)
+            section_list = "\n".join(
+                (
+                    bot_messages.SECTION_SUBSCRIBED_ITEM_FMT 
+                    if section_id in subscriptions 
+                    else bot_messages.SECTION_ITEM_FMT
+                ).format(name)
+                for _, section_id, name in settings.COURSE_SECTIONS
+            )
+            
+            await message.answer(bot_messages.SECTIONS_FMT.format(section_list), settings.BOT_MESSAGE_PARSE_MODE)
+        
+        @self.dispatcher.message_handler(commands=("subscribe", "unsubscribe"))
+        async def subscribe(message: types.Message):
+            command = message.get_command(pure=True)
+            logger.info(f"User {message.from_id} ({message.from_user.full_name} @{message.from_user.username}) used /{command}")
+            user = await self.user_service.get_or_register_user(message.from_id)
+            
+            args = (message.get_args() or "").strip()
+            logger.info(f"{args=}")
+            
+            if len(args) == 0:
+                logger.info("Empty args")
+                await message.answer(bot_messages.SUBSCRIBE_NO_ARGS)
+                return
+            
+            section = self.find_section(args)
+            if section is None:
+                logger.info("Unknown section")
+                await message.answer(bot_messages.SUBSCRIBE_UNKNOWN_SECTION)
+                return
+            
+            _, section_id, name = section
+            should_subscribe = command == "subscribe"
+            is_subscribed = section_id in await self.user_service.get_subscriptions(user.user_id)
+            
+            if is_subscribed == should_subscribe:
+                logger.info(f"Already {'subscribed' if is_subscribed else 'unsubscribed'}")
+                await message.answer(
+                    (
+                        bot_messages.SUBSCRIBED_ALREADY_FMT
+                        if is_subscribed
+                        else bot_messages.UNSUBSCRIBED_ALREADY_FMT
+                    ).format(name),
+                    settings.BOT_MESSAGE_PARSE_MODE
+                )
+                return
+            
+            try:
+                if should_subscribe:
+                    await self.user_service.subscribe(user.user_id, section_id)
+                else:
+                    await self.user_service.unsubscribe(user.user_id, section_id)
+            except Exception as e:
+                logger.exception(e)
+                await message.answer(bot_messages.ERROR)
+                return
+            
+            if user.is_active:
+                await self.schedule_user(user)
+            
+            await message.answer(
+                (bot_messages.SUBSCRIBED_FMT if should_subscribe else bot_messages.UNSUBSCRIBED_FMT).format(name),
+                settings.BOT_MESSAGE_PARSE_MODE
+            )
             
         @self.dispatcher.message_handler()
         async def non_command(message: types.Message):
@@ -158,23 +287,35 @@ class BotService:
             await self.remind_service.set_reminder_active(
                 query_data.task_id, user_id, query_data.set_active
             )
+            await self.reschedule_reminder(user_id, task, query_data.set_active)
             
             # change the button on the old message
-            new_button_text = (
-                bot_messages.TURN_REMINDER_OFF 
-                if query_data.set_active 
-                else bot_messages.TURN_REMINDER_ON
+            old_buttons = (
+                [button for row in callback.message.reply_markup.inline_keyboard for button in row]
+                if callback.message.reply_markup is not None
+                else []
+            )
+            # digests have a button per task, only the pressed one changes
+            is_digest = (
+                query_data.is_digest
+                if query_data.is_digest is not None
+                # the older buttons don't say, a digest with a single task is taken for a reminder
+                else len(old_buttons) > 1
             )
-            # copy query data but invert set_active
-            new_query_data = query_data.copy()
-            new_query_data.set_active = not query_data.set_active
             
-            new_button = types.InlineKeyboardButton(
-                new_button_text, 
-                callback_data=new_query_data.minimized()
+            new_button = self.make_reminder_button(
+                task, 
+                # the new button does the opposite
+                not query_data.set_active, 
+                is_digest
             )
             keyboard = types.InlineKeyboardMarkup(1)
-            keyboard.add(new_button)
+            
+            if is_digest:
+                for button in old_buttons:
+                    keyboard.add(new_button if button.callback_data == callback.data else button)
+            else:
+                keyboard.add(new_button)
             
             # send the message 
             message_text = (
@@ -194,20 +335,176 @@ class BotService:
                 )
             )
         
-    async def remind_active_users(self):
-        # gets all active tasks for that user and reminds them of each of them
-        async def remind_user_all(user: User):
-            reminders = await self.remind_service.get_current_reminders(user.user_id)
+    async def reload_schedule(self):
+        """
+        Rebuilds the reminder schedule from the database, picks up anything the task events missed.
+        The reminders that are still being sent or were postponed keep their in-memory remind times
+        """
+        logger.info("Reloading the reminder schedule")
+        # the schedule is built from last_reminded so the db has to be up to date
+        await self.reminded_time_buffer.flush()
+        
+        keys: set[tuple[int, int]] = set()
+        async for user, task, last_reminded in self.remind_service.iter_reminder_schedule():
+            self.scheduler.add(user, task, last_reminded)
+            keys.add((user.user_id, task.task_id))
+        
+        self.scheduler.retain(keys)
+        
+        logger.info(f"Scheduled {len(self.scheduler)} reminders")
+    
+    async def apply_task_sync(self, result: TaskSyncResult):
+        """
+        Updates the schedule with just the tasks the task service found changes in,
+        the pairs of the new tasks were never reminded about so they come due right away
+        """
+        for task in result.removed:
+            self.scheduler.remove_task(task.task_id)
+        
+        # a revived task can have a changed deadline too
+        task_ids = list(dict.fromkeys(
+            [task.task_id for task in result.new + result.revived]
+            + [change.task.task_id for change in result.changed]
+        ))
+        if not task_ids:
+            return
+        
+        # the schedule is built from last_reminded so the db has to be up to date
+        await self.reminded_time_buffer.flush()
+        
+        reminder_count = 0
+        for task_id in task_ids:
+            keys: set[tuple[int, int]] = set()
+            
+            async for user, task, last_reminded in self.remind_service.iter_reminder_schedule(task_id=task_id):
+                self.scheduler.add(user, task, last_reminded)
+                keys.add((user.user_id, task.task_id))
             
-            await asyncio.gather(*(self.remind_user(user, task) for task in reminders))
+            # the task could be gone for some users, e.g. past the new deadline
+            self.scheduler.retain(keys, task_id=task_id)
+            reminder_count += len(keys)
         
-        active_users = await self.user_service.get_active_users()
-        logger.debug(f"Gotten {len(active_users)} users: {pformat(active_users)}")
+        logger.info(
+            f"Scheduled {reminder_count} reminders for {len(result.new)} new, {len(result.revived)} revived and "
+            f"{len(result.changed)} changed tasks, removed {len(result.removed)} tasks"
+        )
+    
+    async def run_task_events(self):
+        if self.task_events is None:
+            return
         
-        await asyncio.gather(*(remind_user_all(user) for user in active_users))
+        while True:
+            result = await self.task_events.get()
+            
+            try:
+                await self.apply_task_sync(result)
+            except Exception as e:
+                # the periodic reload will pick the tasks up
+                logger.exception(e)
     
-    async def remind_user(self, user: User, task: Task):
-        logger.info(f"reminding user {user.user_id} about {task}")
+    async def schedule_user(self, user: User):
+        schedule = await self.remind_service.get_reminder_schedule(user.user_id)
+        
+        for scheduled_user, task, last_reminded in schedule:
+            self.scheduler.add(scheduled_user, task, last_reminded)
+        
+        self.scheduler.retain({(user.user_id, task.task_id) for _, task, _ in schedule}, user_id=user.user_id)
+    
+    async def reschedule_reminder(self, user_id: int, task: Task, is_active: bool):
+        if not is_active:
+            self.scheduler.remove(user_id, task.task_id)
+            return
+        
+        user = await self.user_service.get_stored_user(user_id)
+        if user is None or not user.is_active:
+            return
+        
+        last_reminded = await self.remind_service.get_reminded_time(task.task_id, user_id)
+        self.scheduler.add(user, task, last_reminded)
+    
+    async def remind_due_users(self, timeout: float | None = None):
+        """
+        Waits until some reminders come due (at most timeout seconds) and puts them in the outbox
+        """
+        reminders = await self.scheduler.wait_due(timeout, settings.REMIND_BATCH_SIZE)
+        if not reminders:
+            return
+        
+        logger.debug(f"Gotten {len(reminders)} due reminders: {pformat(reminders)}")
+        
+        # load shedding, when the outbox falls behind the reminders of the tasks
+        # that aren't urgent get coalesced into digests or postponed altogether
+        backlog = self.outbox.depth
+        coalesce = backlog > settings.OUTBOX_COALESCE_BACKLOG
+        defer = backlog > settings.OUTBOX_DEFER_BACKLOG
+        urgent_before = datetime.now() + timedelta(seconds=settings.OUTBOX_URGENT_SECONDS)
+        
+        if coalesce:
+            logger.warning(f"Outbox backlog is {backlog} messages, shedding non-urgent reminders")
+        
+        single_reminders: list[tuple[User, Task]] = []
+        digests: dict[int, tuple[User, list[Task]]] = {}
+        deferred_count = 0
+        
+        for user, task in reminders:
+            is_urgent = task.deadline is not None and task.deadline < urgent_before
+            
+            if defer and not is_urgent:
+                self.scheduler.postpone(user.user_id, task.task_id, settings.OUTBOX_DEFER_SECONDS)
+                deferred_count += 1
+            elif user.digest_mode or (coalesce and not is_urgent):
+                digests.setdefault(user.user_id, (user, []))[1].append(task)
+            else:
+                single_reminders.append((user, task))
+        
+        if deferred_count > 0:
+            logger.warning(f"Postponed {deferred_count} reminders")
+        
+        # the coroutines are created lazily by the workers as they go,
+        # so there's at most REMIND_WORKERS of them at a time
+        jobs = itertools.chain(
+            (self.remind_user(user, task) for user, task in single_reminders),
+            (self.remind_user_digest(user, tasks) for user, tasks in digests.values())
+        )
+        
+        async def worker():
+            for job in jobs:
+                try:
+                    await job
+                except Exception as e:
+                    logger.exception(e)
+        
+        await asyncio.gather(*(worker() for _ in range(settings.REMIND_WORKERS)))
+    
+    async def run_reminders(self):
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            await self.reload_schedule()
+            reload_time = loop.time() + settings.REMIND_SCHEDULER_RELOAD_SECONDS
+            
+            while (time_left := reload_time - loop.time()) > 0:
+                await self.remind_due_users(time_left)
+    
+    @staticmethod
+    def find_section(query: str) -> tuple[int, int, str] | None:
+        """
+        Finds a section from COURSE_SECTIONS by its name or id
+        """
+        query = query.strip().lower()
+        
+        for section in settings.COURSE_SECTIONS:
+            _, section_id, name = section
+            if query in (name.lower(), str(section_id)):
+                return section
+        
+        return None
+    
+    @staticmethod
+    def format_task(fmt: str, task: Task) -> str:
+        """
+        Fills in a reminder message format (REMINDER_FMT or DIGEST_ITEM_FMT) with the task info
+        """
         # shouldn't happen but here so that pylance doesn't complain
         if task.deadline is None:
             raise ValueError("Task deadline is None")
@@ -222,7 +519,7 @@ class BotService:
         seconds_left = int((task.deadline.astimezone(pytz.utc) - datetime.now(tz=pytz.utc)).total_seconds())
         time_left = timedelta(seconds=seconds_left)
         
-        reminder_text = bot_messages.REMINDER_FMT.format(
+        return fmt.format(
             type_str,
             task.name,
             task.deadline.astimezone(
@@ -232,70 +529,200 @@ class BotService:
             task.task_type.value,
             str(task.task_id)
         )
+    
+    @staticmethod
+    def make_reminder_button(task: Task, set_active: bool, is_digest: bool) -> types.InlineKeyboardButton:
+        query = ReminderInlineQueryData(task_id=task.task_id, set_active=set_active, is_digest=is_digest)
+        
+        if is_digest:
+            text = (
+                bot_messages.DIGEST_TURN_REMINDER_ON_FMT
+                if set_active
+                else bot_messages.DIGEST_TURN_REMINDER_OFF_FMT
+            ).format(task.name)
+        else:
+            text = bot_messages.TURN_REMINDER_ON if set_active else bot_messages.TURN_REMINDER_OFF
+        
+        return types.InlineKeyboardButton(text, callback_data=query.minimized())
+    
+    @staticmethod
+    def get_priority(task: Task) -> float:
+        # the closer the deadline the sooner the reminder should be sent
+        return task.deadline.timestamp() if task.deadline is not None else float("inf")
+    
+    async def remind_user(self, user: User, task: Task):
+        logger.info(f"reminding user {user.user_id} about {task}")
+        
+        reminder_text = self.format_task(bot_messages.REMINDER_FMT, task)
         
         # making the inline keyboard
         keyboard = types.InlineKeyboardMarkup(1)
+        # change if we ever remind of inactive tasks
+        keyboard.add(self.make_reminder_button(task, False, False))
         
-        query = ReminderInlineQueryData(
-            task_id=task.task_id,
-            set_active=False    # change if we ever remind of inactive tasks
-        )
-        callback_data = query.minimized()
-        
-        button = types.InlineKeyboardButton(
-            bot_messages.TURN_REMINDER_OFF,
-            callback_data=callback_data
-        )
+        async def on_sent():
+            await self.reminded_time_buffer.add(task.task_id, user.user_id, datetime.now())
         
-        keyboard.add(button)
+        async def on_error(e: Exception):
+            await self.handle_send_error(user, [task], e)
         
-        try:
-            await self.bot.send_message(
-                user.user_id, 
-                reminder_text, 
-                settings.BOT_MESSAGE_PARSE_MODE,
+        await self.outbox.put(
+            OutgoingMessage(
+                chat_id=user.user_id,
+                text=reminder_text,
                 reply_markup=keyboard,
-                disable_web_page_preview=True
+                priority=self.get_priority(task),
+                on_sent=on_sent,
+                on_error=on_error
             )
+        )
+    
+    async def remind_user_digest(self, user: User, tasks: list[Task]):
+        """
+        Reminds the user about all the tasks in one message (or a few if there are too many tasks)
+        """
+        if len(tasks) == 1:
+            await self.remind_user(user, tasks[0])
+            return
+        
+        logger.info(f"reminding user {user.user_id} about {len(tasks)} tasks in a digest")
+        tasks = sorted(tasks, key=lambda task: task.deadline or datetime.max)
+        
+        for i in range(0, len(tasks), settings.DIGEST_MAX_TASKS):
+            chunk = tasks[i:i + settings.DIGEST_MAX_TASKS]
             
-            await self.remind_service.set_reminded_time(task.task_id, user.user_id, datetime.now())
+            digest_text = bot_messages.DIGEST_FMT.format(
+                len(chunk),
+                "\n".join(self.format_task(bot_messages.DIGEST_ITEM_FMT, task) for task in chunk)
+            )
             
-        except exceptions.BotBlocked as e:
-            logger.error(f"User {user.user_id} blocked the bot")
+            keyboard = types.InlineKeyboardMarkup(1)
+            for task in chunk:
+                keyboard.add(self.make_reminder_button(task, False, True))
+            
+            # binding the chunk, it changes on the next iteration
+            async def on_sent(chunk: list[Task] = chunk):
+                now = datetime.now()
+                for task in chunk:
+                    await self.reminded_time_buffer.add(task.task_id, user.user_id, now)
+            
+            async def on_error(e: Exception, chunk: list[Task] = chunk):
+                await self.handle_send_error(user, chunk, e)
+            
+            await self.outbox.put(
+                OutgoingMessage(
+                    chat_id=user.user_id,
+                    text=digest_text,
+                    reply_markup=keyboard,
+                    # the chunks are sorted by deadline
+                    priority=self.get_priority(chunk[0]),
+                    on_sent=on_sent,
+                    on_error=on_error
+                )
+            )
+    
+    async def handle_send_error(self, user: User, tasks: list[Task], e: Exception):
+        if not isinstance(e, exceptions.BotBlocked):
             logger.exception(e)
-            logger.info(f"Making user {user.user_id} inactive")
             
-            user.is_active = False
-            
-            try:
-                await self.user_service.update_user(user)
-            except Exception as e:
-                logger.exception(e)
-                
+            # the scheduler took the reminders for sent when they came due, they're tried again soon
+            for task in tasks:
+                self.scheduler.postpone(user.user_id, task.task_id, settings.REMIND_RETRY_SECONDS)
+            return
+        
+        logger.error(f"User {user.user_id} blocked the bot")
+        logger.exception(e)
+        
+        # might have already been done by another reminder of the same user
+        if not user.is_active:
+            return
+        
+        logger.info(f"Making user {user.user_id} inactive")
+        
+        user.is_active = False
+        self.scheduler.remove_user(user.user_id)
+        
+        try:
+            await self.user_service.update_user(user)
         except Exception as e:
             logger.exception(e)
     
 
-    async def run_bot_non_blocking(self):
-        asyncio.create_task(self.dispatcher.start_polling(int(settings.TIMEOUT)))
-        
     async def run_bot(self):
-        await self.dispatcher.start_polling(int(settings.TIMEOUT))
+        # getUpdates doesn't work while a webhook is set
+        await self.bot.delete_webhook()
         
-
-def bot_worker():
-    async def main_coroutine():
-        async with aiosqlite.connect(settings.DB_PATH) as connection:
-            try:
-                service = BotService(connection, token)
-                await service.run_bot_non_blocking()
-                while True:
-                    await service.remind_active_users()
-                    await asyncio.sleep(settings.BOT_SERVICE_INTERVAL_SECONDS)
-            except Exception as e:
-                logger.exception(e)
+        try:
+            await self.dispatcher.start_polling(int(settings.TIMEOUT))
+            # start_polling swallows the cancellation and returns, only stop_polling resets the flag
+            was_cancelled = self.dispatcher.is_polling()
+        finally:
+            # start_polling refuses to run again until the flag is reset,
+            # and it finishes by resolving the close waiter so the next run needs a fresh one
+            self.dispatcher.stop_polling()
+            self.dispatcher._dispatcher_close_waiter = None
+        
+        if was_cancelled:
+            raise asyncio.CancelledError()
     
-    with open("API_TOKEN", "r", encoding="utf-8") as f:
-        token = f.read().strip()
+    def create_webhook_app(self, secret_token: str | None = None) -> web.Application:
+        """
+        aiohttp app that hands the updates POSTed to settings.WEBHOOK_PATH to the dispatcher,
+        at most WEBHOOK_MAX_CONCURRENT_UPDATES of them are handled at a time and the rest wait
+        """
+        semaphore = asyncio.Semaphore(settings.WEBHOOK_MAX_CONCURRENT_UPDATES)
+        
+        @web.middleware
+        async def limit_concurrency(request: web.Request, handler):
+            if secret_token is not None and request.headers.get(WEBHOOK_SECRET_HEADER) != secret_token:
+                raise web.HTTPUnauthorized()
+            
+            async with semaphore:
+                return await handler(request)
+        
+        app = web.Application(middlewares=[limit_concurrency])
+        configure_app(self.dispatcher, app, settings.WEBHOOK_PATH)
+        
+        return app
     
-    asyncio.run(main_coroutine())
+    async def run_webhook(self):
+        # a new secret every start, only the Telegram servers get to know it
+        secret_token = secrets.token_urlsafe(32)
+        runner = web.AppRunner(self.create_webhook_app(secret_token))
+        await runner.setup()
+        
+        try:
+            site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+            await site.start()
+            
+            await self.bot.set_webhook(
+                settings.WEBHOOK_URL + settings.WEBHOOK_PATH,
+                max_connections=settings.WEBHOOK_MAX_CONCURRENT_UPDATES,
+                secret_token=secret_token,
+            )
+            logger.info(f"Receiving updates on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+            
+            # the server handles the updates in the background until this is cancelled
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await runner.cleanup()
+    
+    async def run_updates(self):
+        match settings.BOT_UPDATE_MODE:
+            case "polling":
+                await self.run_bot()
+            case "webhook":
+                await self.run_webhook()
+            case _:
+                raise ValueError(f"Unknown bot update mode: {settings.BOT_UPDATE_MODE}")
+    
+    async def close(self):
+        self.dispatcher.stop_polling()
+        
+        try:
+            # not losing the reminded times that haven't been written yet
+            await self.reminded_time_buffer.flush()
+        finally:
+            session = await self.bot.get_session()
+            if session is not None:
+                await session.close()
@@ -13,6 +13,14 @@ HELP = """List of commands:
 /set_remind_interval -- set the time between reminders, format: X days Y hours Z minutes.
 example: "/set_remind_interval 5 days".
 
+/digest -- get all reminders in one message, turn it off with "/digest off".
+
+/sections -- see the sections you can get reminders for.
+
+/subscribe -- get reminders for a section, example: "/subscribe English".
+
+/unsubscribe -- stop getting reminders for a section.
+
 /stop -- stop receiving reminders.
 """
 UNKNOWN = "Command unrecognized.\nType /help to see the list of commands."
@@ -27,6 +35,25 @@ INTERVAL_LESS_THAN_SECONDS_FMT = "Error: Remind interval should be longer than {
 
 INTERVAL_CHANGED_FMT = "Your remind interval has been successfully changed to: {0}."
 
+DIGEST_INVALID_ARGS = 'Error: Expected "on" or "off".'
+DIGEST_ALREADY_FMT = "Digest mode is already {0}."
+DIGEST_TURNED_FMT = "Digest mode is now turned {0}."
+
+SECTIONS_FMT = """Sections:
+
+{0}
+
+Use /subscribe and /unsubscribe with the name of the section."""
+SECTION_ITEM_FMT = "<b>{0}</b>"
+SECTION_SUBSCRIBED_ITEM_FMT = "<b>{0}</b> (subscribed)"
+
+SUBSCRIBE_NO_ARGS = "Error: No section was given.\nType /sections to see the list of sections."
+SUBSCRIBE_UNKNOWN_SECTION = "Error: Unknown section.\nType /sections to see the list of sections."
+SUBSCRIBED_ALREADY_FMT = "You are already subscribed to <b>{0}</b>."
+SUBSCRIBED_FMT = "You are now subscribed to <b>{0}</b>."
+UNSUBSCRIBED_ALREADY_FMT = "You are not subscribed to <b>{0}</b>."
+UNSUBSCRIBED_FMT = "You are no longer subscribed to <b>{0}</b>."
+
 REMINDER_FMT = """You have a <b>{0}</b>
 <b>{1}</b>
 Due on <b>{2}</b>
@@ -37,8 +64,23 @@ New SmartLMS link: https://smartedu.hse.ru/mod/{4}/{5}
 Old SmartLMS link: https://edu.hse.ru/mod/{4}/view.php?id={5}
 """
 
+DIGEST_FMT = """You have <b>{0}</b> upcoming tasks:
+
+{1}
+"""
+
+DIGEST_ITEM_FMT = """<b>{1}</b> ({0})
+Due on <b>{2}</b>
+Time remaining: <b>{3}</b>
+https://smartedu.hse.ru/mod/{4}/{5}
+"""
+
 TURN_REMINDER_OFF = "Do not remind about that"
 TURN_REMINDER_ON = "Turn reminders back on"
 
+# digests have a button per task
+DIGEST_TURN_REMINDER_OFF_FMT = "Do not remind about {0}"
+DIGEST_TURN_REMINDER_ON_FMT = "Turn reminders for {0} back on"
+
 REMINDER_TURNED_OFF_FMT = "Will no longer remind about <b>{0}</b>."
 REMINDER_TURNED_ON_FMT = "Reminders for <b>{0}</b> have been turned on"
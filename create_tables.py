@@ -10,32 +10,70 @@ import settings
 queries = (
     """--sql
         CREATE TABLE IF NOT EXISTS tokens (
-            title TEXT PRIMARY KEY,
+            -- username of the account the token belongs to
+            account TEXT NOT NULL,
+            title TEXT NOT NULL,
             value TEXT NOT NULL,
-            expiration_dt REAL NOT NULL
+            expiration_dt REAL NOT NULL,
+            
+            PRIMARY KEY (account, title)
         );
     """,
     """--sql
         CREATE INDEX IF NOT EXISTS token_idx 
-        ON tokens(title, expiration_dt);
+        ON tokens(account, title, expiration_dt);
     """,
     """--sql
         CREATE TABLE IF NOT EXISTS lmstasks (
             id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             type TEXT NOT NULL,
-            deadline REAL NOT NULL
+            deadline REAL NOT NULL,
+            -- hash of the module data, to notice when the task changes on the LMS
+            content_hash TEXT NOT NULL DEFAULT '',
+            -- when the deadline was last fetched from the LMS
+            last_verified REAL NOT NULL DEFAULT 0,
+            -- set when the task disappears from the course, NULL for live tasks
+            removed_at REAL DEFAULT NULL,
+            -- where the task is on the LMS
+            course_id INTEGER NOT NULL DEFAULT 0,
+            section_id INTEGER NOT NULL DEFAULT 0
         );
     """,
     """--sql
         CREATE INDEX IF NOT EXISTS lmstasks_idx 
         ON lmstasks(id, deadline, name);
     """,
+    # only covers the live tasks, so looking them up never touches the removed ones
+    """--sql
+        CREATE INDEX IF NOT EXISTS lmstasks_live_idx
+        ON lmstasks(id, deadline, name, type)
+        WHERE removed_at IS NULL;
+    """,
+    """--sql
+        CREATE INDEX IF NOT EXISTS lmstasks_section_idx
+        ON lmstasks(section_id, removed_at);
+    """,
     """--sql
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
             is_active INTEGER NOT NULL DEFAULT 1 CHECK(is_active = 0 OR is_active = 1),
-            remind_interval REAL NOT NULL DEFAULT 86400
+            remind_interval REAL NOT NULL DEFAULT 86400,
+            digest_mode INTEGER NOT NULL DEFAULT 0 CHECK(digest_mode = 0 OR digest_mode = 1)
+        );
+    """,
+    # the sections each user gets reminders for
+    """--sql
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            user_id INTEGER NOT NULL,
+            section_id INTEGER NOT NULL,
+            
+            PRIMARY KEY (user_id, section_id),
+            
+            FOREIGN KEY (user_id)
+                REFERENCES users(id)
+                    ON UPDATE CASCADE
+                    ON DELETE CASCADE
         );
     """,
     """--sql
@@ -58,6 +96,106 @@ queries = (
                     ON DELETE CASCADE
         );
     """,
+    """--sql
+        CREATE TABLE IF NOT EXISTS deadline_changes (
+            id INTEGER PRIMARY KEY,
+            task_id INTEGER NOT NULL,
+            old_deadline REAL NOT NULL,
+            new_deadline REAL NOT NULL,
+            changed_at REAL NOT NULL,
+            
+            FOREIGN KEY (task_id)
+                REFERENCES lmstasks(id)
+                    ON UPDATE CASCADE
+                    ON DELETE CASCADE
+        );
+    """,
+    """--sql
+        CREATE INDEX IF NOT EXISTS deadline_changes_idx
+        ON deadline_changes(changed_at, task_id);
+    """,
+    # when syncs of each section found changes, used for learning when to poll the LMS
+    """--sql
+        CREATE TABLE IF NOT EXISTS section_changes (
+            section_id INTEGER NOT NULL,
+            changed_at REAL NOT NULL
+        );
+    """,
+    """--sql
+        CREATE INDEX IF NOT EXISTS section_changes_idx
+        ON section_changes(changed_at, section_id);
+    """,
+    """--sql
+        CREATE INDEX IF NOT EXISTS reminders_user_idx
+        ON reminders(user_id);
+    """,
+)
+
+# tables whose primary key changed, sqlite can't alter it so the old versions are dropped.
+# (table, a column only the new version has), only ever used for tables that can be rebuilt from scratch
+table_migrations = (
+    # the tokens were only kept by title before there could be several accounts,
+    # they are just gotten again on the next login
+    ("tokens", "account"),
+)
+
+# columns added after the tables were first created,
+# sqlite can't do ADD COLUMN IF NOT EXISTS so these are allowed to fail
+column_migrations = (
+    """--sql
+        ALTER TABLE lmstasks ADD COLUMN content_hash TEXT NOT NULL DEFAULT '';
+    """,
+    """--sql
+        ALTER TABLE lmstasks ADD COLUMN last_verified REAL NOT NULL DEFAULT 0;
+    """,
+    """--sql
+        ALTER TABLE lmstasks ADD COLUMN removed_at REAL DEFAULT NULL;
+    """,
+    """--sql
+        ALTER TABLE users ADD COLUMN digest_mode INTEGER NOT NULL DEFAULT 0
+        CHECK(digest_mode = 0 OR digest_mode = 1);
+    """,
+    """--sql
+        ALTER TABLE lmstasks ADD COLUMN course_id INTEGER NOT NULL DEFAULT 0;
+    """,
+    """--sql
+        ALTER TABLE lmstasks ADD COLUMN section_id INTEGER NOT NULL DEFAULT 0;
+    """,
+)
+
+# run once, right after the table is first created, i.e. when an older database is brought up to date
+creation_migrations = {
+    # everyone got reminders about every task before there could be several sections,
+    # so every existing user is subscribed to the section the tasks came from back then
+    "subscriptions": (
+        f"""--sql
+            INSERT OR IGNORE INTO subscriptions(user_id, section_id)
+            SELECT id, {settings.SUBMODULE_ID} FROM users;
+        """,
+    ),
+}
+
+# bringing the data in older databases up to date, these are safe to run every time
+data_migrations = (
+    # the tasks from before there could be several sections
+    f"""--sql
+        UPDATE lmstasks
+        SET course_id = {settings.COURSE_ID}, section_id = {settings.SUBMODULE_ID}
+        WHERE section_id = 0;
+    """,
+    # users are subscribed to the sections they have reminders in,
+    # unsubscribing deletes the reminders so this doesn't bring subscriptions back
+    """--sql
+        INSERT OR IGNORE INTO subscriptions(user_id, section_id)
+        SELECT DISTINCT reminders.user_id, lmstasks.section_id
+        FROM reminders JOIN lmstasks ON lmstasks.id = reminders.task_id;
+    """,
+    # every (task, subscribed user) pair has a reminders row
+    """--sql
+        INSERT OR IGNORE INTO reminders(task_id, user_id)
+        SELECT lmstasks.id, subscriptions.user_id 
+        FROM lmstasks JOIN subscriptions ON subscriptions.section_id = lmstasks.section_id;
+    """,
 )
 
 
@@ -65,8 +203,34 @@ def main():
     with sqlite3.connect(settings.DB_PATH) as connection:
         cursor = connection.cursor()
         
+        for table, new_column in table_migrations:
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table});")]
+            
+            if columns and new_column not in columns:
+                cursor.execute(f"DROP TABLE {table};")
+        
+        for query in column_migrations:
+            try:
+                cursor.execute(query)
+            except sqlite3.OperationalError as e:
+                # either the column is already there or the table is yet to be created
+                if "duplicate column name" not in str(e) and "no such table" not in str(e):
+                    raise
+        
+        existing_tables = {
+            row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table';")
+        }
+        
         for query in queries:
             cursor.execute(query)
+        
+        for table, migrations in creation_migrations.items():
+            if table not in existing_tables:
+                for query in migrations:
+                    cursor.execute(query)
+        
+        for query in data_migrations:
+            cursor.execute(query)
             
         cursor.close()
         
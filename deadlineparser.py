@@ -0,0 +1,194 @@
+"""
+Fast parsing of the few date formats SmartLMS and HSE auth actually produce,
+dateparser is only used for whatever these don't recognize
+"""
+from datetime import datetime
+from functools import lru_cache
+import dateparser
+import pytz
+import re
+
+
+MSK_TIMEZONE = "Europe/Moscow"
+
+# the same strings come up on every sync
+CACHE_SIZE = 4096
+
+MONTHS = {
+    name: number
+    for number, names in enumerate(
+        (
+            ("january", "jan"),
+            ("february", "feb"),
+            ("march", "mar"),
+            ("april", "apr"),
+            ("may", ),
+            ("june", "jun"),
+            ("july", "jul"),
+            ("august", "aug"),
+            ("september", "sep", "sept"),
+            ("october", "oct"),
+            ("november", "nov"),
+            ("december", "dec"),
+        ),
+        start=1
+    )
+    for name in names
+}
+
+# "Monday, 26 September 2022, 11:59 PM", the weekday is optional,
+# also found inside longer lines like "This quiz closes on Monday, 26 September 2022, 11:59 PM"
+DAY_DATETIME_RE = re.compile(
+    r"(?:[A-Za-z]+,\s*)?"
+    r"(?P<day>\d{1,2})\s+(?P<month>[A-Za-z]+)\s+(?P<year>\d{4}),?\s+"
+    r"(?P<hour>\d{1,2}):(?P<minute>\d{2})\s*(?P<meridiem>[AaPp]\.?[Mm]\.?)?"
+)
+
+# "Wed, 21 Oct 2015 07:28:00 GMT" or "Wed, 21-Oct-2015 07:28:00 GMT" (used in cookies)
+RFC1123_RE = re.compile(
+    r"(?:[A-Za-z]{3},\s*)?"
+    r"(?P<day>\d{1,2})[\s-](?P<month>[A-Za-z]{3})[\s-](?P<year>\d{2,4})\s+"
+    r"(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})\s*(?:GMT|UTC)"
+)
+
+
+def _to_24_hours(hour: int, meridiem: str | None) -> int:
+    if meridiem is None:
+        return hour
+
+    is_pm = meridiem[0].lower() == "p"
+    return hour % 12 + (12 if is_pm else 0)
+
+
+def parse_day_datetime(text: str, timezone: str = MSK_TIMEZONE) -> datetime | None:
+    """
+    Fast path only, returns None if the text isn't in the SmartLMS format
+    """
+    match = DAY_DATETIME_RE.search(text)
+    if match is None:
+        return None
+
+    month = MONTHS.get(match["month"].lower())
+    if month is None:
+        return None
+
+    try:
+        naive = datetime(
+            int(match["year"]),
+            month,
+            int(match["day"]),
+            _to_24_hours(int(match["hour"]), match["meridiem"]),
+            int(match["minute"]),
+        )
+    except ValueError:
+        return None
+
+    return pytz.timezone(timezone).localize(naive)
+
+
+def parse_rfc1123(text: str) -> datetime | None:
+    """
+    Fast path only, returns None if the text isn't an RFC 1123 date
+    """
+    match = RFC1123_RE.search(text)
+    if match is None:
+        return None
+
+    month = MONTHS.get(match["month"].lower())
+    if month is None:
+        return None
+
+    year = int(match["year"])
+    # two digit years from old cookie formats
+    if year < 100:
+        year += 2000
+
+    try:
+        return datetime(
+            year,
+            month,
+            int(match["day"]),
+            int(match["hour"]),
+            int(match["minute"]),
+            int(match["second"]),
+            tzinfo=pytz.utc,
+        )
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_deadline(text: str, timezone: str = MSK_TIMEZONE) -> datetime | None:
+    """
+    Parses a deadline from a task page, the result is timezone aware
+    """
+    deadline = parse_day_datetime(text, timezone)
+    if deadline is not None:
+        return deadline
+
+    settings = {
+        "TIMEZONE": timezone,
+        "RETURN_AS_TIMEZONE_AWARE": True
+    }
+    return dateparser.parse(text, settings=settings)    # type: ignore
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_cookie_date(text: str) -> datetime | None:
+    """
+    Parses the expiration date of a cookie
+    """
+    expires = parse_rfc1123(text)
+    if expires is not None:
+        return expires
+
+    return dateparser.parse(text)
+
+
+def main():
+    """
+    Micro-benchmark of the fast path against dateparser
+    """
+    from timeit import timeit
+
+    samples = (
+        ("Monday, 26 September 2022, 11:59 PM", parse_day_datetime, parse_deadline, "deadline"),
+        (" 3 October 2022, 9:00 AM", parse_day_datetime, parse_deadline, "deadline"),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", parse_rfc1123, parse_cookie_date, "cookie"),
+    )
+    dateparser_settings = {
+        "TIMEZONE": MSK_TIMEZONE,
+        "RETURN_AS_TIMEZONE_AWARE": True
+    }
+    runs = 200
+
+    # dateparser loads its language data on first use, not counting that
+    dateparser.parse(samples[0][0], settings=dateparser_settings)
+
+    for text, fast_parser, cached_parser, kind in samples:
+        fast_result = fast_parser(text)
+        slow_result = dateparser.parse(text, settings=dateparser_settings if kind == "deadline" else None)
+
+        fast_time = timeit(lambda: fast_parser(text), number=runs) / runs
+        slow_time = timeit(
+            lambda: dateparser.parse(text, settings=dateparser_settings if kind == "deadline" else None),
+            number=runs
+        ) / runs
+        cached_parser.cache_clear()
+        cached_parser(text)
+        cached_time = timeit(lambda: cached_parser(text), number=runs) / runs
+
+        same = (
+            fast_result is not None
+            and slow_result is not None
+            and fast_result.timestamp() == slow_result.timestamp()
+        )
+        print(f"{text!r}")
+        print(f"    fast:       {fast_time * 1e6:10.1f} us")
+        print(f"    dateparser: {slow_time * 1e6:10.1f} us ({slow_time / fast_time:.0f}x slower)")
+        print(f"    cached:     {cached_time * 1e6:10.1f} us")
+        print(f"    same result: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Passing events between the services running on the same event loop
+"""
+from typing import Generic, TypeVar
+import asyncio
+import logging
+import settings
+
+
+logger = logging.getLogger("event_bus")
+logger.setLevel(settings.LOG_LEVEL)
+
+T = TypeVar("T")
+
+
+class EventBus(Generic[T]):
+    """
+    Every published event goes to the queue of every subscriber.
+
+    Publishing never waits, when a subscriber falls max_queue_size events behind
+    the new ones are dropped for it, so subscribers should be able to catch up some other way
+    """
+    def __init__(self, max_queue_size: int = settings.EVENT_BUS_QUEUE_SIZE):
+        self.max_queue_size = max_queue_size
+        self.__queues: dict[str, asyncio.Queue[T]] = {}
+
+    def subscribe(self, name: str) -> asyncio.Queue[T]:
+        """
+        Only the events published after subscribing are received
+        """
+        queue: asyncio.Queue[T] = asyncio.Queue(self.max_queue_size)
+        self.__queues[name] = queue
+
+        return queue
+
+    def unsubscribe(self, name: str):
+        self.__queues.pop(name, None)
+
+    def publish(self, event: T):
+        for name, queue in self.__queues.items():
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Subscriber {name} is {queue.qsize()} events behind, dropping an event")
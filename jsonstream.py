@@ -0,0 +1,112 @@
+"""
+Splitting a JSON array into its items while it's still being downloaded
+"""
+import re
+
+
+class NotAJSONArrayError(ValueError):
+    pass
+
+
+class JSONArrayScanner:
+    """
+    Feeds on the text of a top level JSON array chunk by chunk and returns the source text
+    of each item as soon as it's complete.
+
+    Only the item currently being read is kept, the items aren't parsed,
+    so the caller can json.loads just the ones it needs
+    """
+    # whole strings are skipped in one go, a lone quote means the string goes on into the next chunk
+    STRUCTURE_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}",]')
+    STRING_END_RE = re.compile(r'["\\]')
+
+    def __init__(self):
+        self.__depth = 0
+        self.__in_string = False
+        self.__escaped = False
+        self.__item_parts: list[str] = []
+        self.started = False
+        self.finished = False
+
+    def __finish_item(self, items: list[str]):
+        item = "".join(self.__item_parts).strip()
+        self.__item_parts = []
+
+        if item:
+            items.append(item)
+
+    def feed(self, chunk: str) -> list[str]:
+        """
+        Returns the items completed by this chunk, raises NotAJSONArrayError
+        if the text turns out to be something other than an array
+        """
+        items: list[str] = []
+        if self.finished:
+            return items
+
+        position = 0
+        # where the text of the current item starts in this chunk
+        item_start = 0
+
+        while position < len(chunk):
+            if self.__in_string:
+                if self.__escaped:
+                    self.__escaped = False
+                    position += 1
+                    continue
+
+                found = self.STRING_END_RE.search(chunk, position)
+                if found is None:
+                    position = len(chunk)
+                    break
+
+                position = found.end()
+                if found.group() == "\\":
+                    self.__escaped = True
+                else:
+                    self.__in_string = False
+                continue
+
+            found = self.STRUCTURE_RE.search(chunk, position)
+            if found is None:
+                position = len(chunk)
+                break
+
+            char = found.group()
+            position = found.end()
+
+            if len(char) > 1:
+                # a complete string
+                continue
+
+            if not self.started:
+                if char != "[":
+                    raise NotAJSONArrayError(f"Expected a JSON array, got {char!r}")
+
+                self.started = True
+                self.__depth = 1
+                item_start = position
+                continue
+
+            match char:
+                case '"':
+                    self.__in_string = True
+                case "[" | "{":
+                    self.__depth += 1
+                case "]" | "}":
+                    self.__depth -= 1
+
+                    if self.__depth == 0:
+                        self.__item_parts.append(chunk[item_start:found.start()])
+                        self.__finish_item(items)
+                        self.finished = True
+                        return items
+                case "," if self.__depth == 1:
+                    self.__item_parts.append(chunk[item_start:found.start()])
+                    self.__finish_item(items)
+                    item_start = position
+
+        if self.started:
+            self.__item_parts.append(chunk[item_start:])
+
+        return items
@@ -0,0 +1,350 @@
+"""
+Creating the http clients used for talking to HSE servers
+"""
+from time import monotonic, perf_counter
+import asyncio
+import httpx
+import logging
+import random
+import settings
+
+try:
+    # optional, installed with httpx[http2]
+    import h2
+except ImportError:
+    h2 = None
+
+try:
+    # optional, installed with httpx[brotli]
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+logger = logging.getLogger("lms_http")
+logger.setLevel(settings.LOG_LEVEL)
+
+# request extension for responses read with client.stream(),
+# the latency hook doesn't read their bodies so that they aren't buffered whole
+STREAMED_BODY = "lms_streamed_body"
+SENT_AT = "lms_sent_at"
+# request extension for POSTs that are safe to send again, e.g. read-only web service calls,
+# other POSTs (like the login form with the password in it) are never retried
+RETRY_SAFE = "lms_retry_safe"
+# the methods that are always safe to retry
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# time spent opening new connections for the request
+HANDSHAKE_SECONDS = "lms_handshake_seconds"
+# httpcore trace events that make up opening a connection
+HANDSHAKE_STEPS = ("connection.connect_tcp", "connection.start_tls")
+
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+
+
+class LatencyStats:
+    """
+    Per host request latency, collected by the clients made by create_client,
+    the time spent opening connections is counted separately from the requests themselves
+    """
+    def __init__(self):
+        # host -> (request count, total request seconds, max request seconds, new connections, handshake seconds)
+        self.__hosts: dict[str, tuple[int, float, float, int, float]] = {}
+
+    def record(self, host: str, seconds: float, handshake_seconds: float = 0.0):
+        count, total, max_seconds, connections, handshake_total = self.__hosts.get(host, (0, 0.0, 0.0, 0, 0.0))
+        request_seconds = seconds - handshake_seconds
+
+        self.__hosts[host] = (
+            count + 1, 
+            total + request_seconds, 
+            max(max_seconds, request_seconds),
+            connections + (handshake_seconds > 0),
+            handshake_total + handshake_seconds
+        )
+
+    def reset(self):
+        self.__hosts.clear()
+
+    def summary(self) -> str:
+        if not self.__hosts:
+            return "no requests"
+
+        return ", ".join(
+            f"{host}: {count} requests, avg {total / count * 1000:.0f} ms, max {max_seconds * 1000:.0f} ms, "
+            f"{connections} new connections"
+            + (f" (avg handshake {handshake_total / connections * 1000:.0f} ms)" if connections else "")
+            for host, (count, total, max_seconds, connections, handshake_total) in self.__hosts.items()
+        )
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    The host has been failing, requests to it aren't sent until its circuit breaker lets them through
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after it fails too many times in a row.
+    
+    closed: requests go through,
+    open: requests fail right away, for reset_seconds,
+    half-open: one request is let through to see if the host is back, closes the breaker if it succeeds
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.is_probing = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        
+        if monotonic() - self.opened_at < self.reset_seconds:
+            return self.OPEN
+        
+        return self.HALF_OPEN
+    
+    def allow_request(self) -> bool:
+        match self.state:
+            case self.CLOSED:
+                return True
+            case self.HALF_OPEN if not self.is_probing:
+                self.is_probing = True
+                return True
+            case _:
+                return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.is_probing = False
+    
+    def record_cancel(self):
+        # the request never finished, so it tells nothing about the host
+        self.is_probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self.is_probing = False
+        
+        # a failed probe opens it again right away
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = monotonic()
+
+
+class CircuitBreakers:
+    """
+    A circuit breaker per host, outlives the clients so that the state carries over between syncs
+    """
+    def __init__(
+        self, 
+        failure_threshold: int = settings.CIRCUIT_BREAKER_FAILURES, 
+        reset_seconds: float = settings.CIRCUIT_BREAKER_RESET_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.__breakers: dict[str, CircuitBreaker] = {}
+    
+    def get(self, host: str) -> CircuitBreaker:
+        if host not in self.__breakers:
+            self.__breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+        
+        return self.__breakers[host]
+    
+    def states(self) -> dict[str, str]:
+        return {host: breaker.state for host, breaker in self.__breakers.items()}
+    
+    def summary(self) -> str:
+        if not self.__breakers:
+            return "no requests"
+        
+        return ", ".join(
+            f"{host}: {breaker.state} ({breaker.failures} failures in a row)"
+            for host, breaker in self.__breakers.items()
+        )
+
+
+class RetryingTransport(httpx.AsyncBaseTransport):
+    """
+    Retries failed requests with exponential backoff and full jitter,
+    going through the host's circuit breaker for every attempt.
+    Only idempotent requests and the ones marked RETRY_SAFE are retried
+    """
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    
+    def __init__(
+        self, 
+        transport: httpx.AsyncBaseTransport, 
+        circuit_breakers: CircuitBreakers,
+        retries: int = settings.HTTP_RETRIES,
+        backoff_seconds: float = settings.HTTP_RETRY_BACKOFF_SECONDS,
+        max_backoff_seconds: float = settings.HTTP_RETRY_MAX_BACKOFF_SECONDS
+    ):
+        self.transport = transport
+        self.circuit_breakers = circuit_breakers
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+    
+    def get_backoff(self, attempt: int, response: httpx.Response | None) -> float:
+        backoff = random.uniform(0, min(self.backoff_seconds * 2 ** attempt, self.max_backoff_seconds))
+        
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            backoff = max(backoff, min(float(retry_after), self.max_backoff_seconds))
+        
+        return backoff
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        breaker = self.circuit_breakers.get(host)
+        retries = (
+            self.retries 
+            if request.method in IDEMPOTENT_METHODS or request.extensions.get(RETRY_SAFE) 
+            else 0
+        )
+        attempt = 0
+        
+        while True:
+            if not breaker.allow_request():
+                raise CircuitOpenError(f"Circuit breaker for {host} is open", request=request)
+            
+            response: httpx.Response | None = None
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                
+                if attempt >= retries:
+                    raise
+                
+                logger.warning(f"{request.method} {host}{request.url.path} failed: {e!r}, retrying")
+            except BaseException:
+                breaker.record_cancel()
+                raise
+            else:
+                if response.status_code not in self.RETRY_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+                
+                breaker.record_failure()
+                
+                if attempt >= retries:
+                    return response
+                
+                logger.warning(f"{request.method} {host}{request.url.path} -> {response.status_code}, retrying")
+                await response.aclose()
+            
+            await asyncio.sleep(self.get_backoff(attempt, response))
+            attempt += 1
+    
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def create_client(
+    latency_stats: LatencyStats | None = None, 
+    circuit_breakers: CircuitBreakers | None = None
+) -> httpx.AsyncClient:
+    """
+    Makes a client with a bounded keep-alive connection pool and http2 if it's available,
+    request latencies are recorded into latency_stats if it's given
+    (for streamed responses it's the time until the headers came in).
+    
+    Failed requests are retried, circuit_breakers should be kept between clients
+    for the breakers to notice an outage, a new set is used if it's not given
+    """
+    async def stamp_request(request: httpx.Request):
+        request.extensions[SENT_AT] = perf_counter()
+        request.extensions[HANDSHAKE_SECONDS] = 0.0
+        started: dict[str, float] = {}
+
+        async def trace(event_name: str, info: dict):
+            step, _, stage = event_name.rpartition(".")
+            if step not in HANDSHAKE_STEPS:
+                return
+
+            if stage == "started":
+                started[step] = perf_counter()
+            elif stage == "complete" and step in started:
+                request.extensions[HANDSHAKE_SECONDS] += perf_counter() - started.pop(step)
+
+        request.extensions["trace"] = trace
+    
+    async def log_latency(response: httpx.Response):
+        if not response.request.extensions.get(STREAMED_BODY):
+            # every caller reads the body anyway, so it's counted in
+            await response.aread()
+        
+        seconds = perf_counter() - response.request.extensions[SENT_AT]
+        handshake_seconds = response.request.extensions[HANDSHAKE_SECONDS]
+
+        logger.debug(
+            f"{response.request.method} {response.request.url.host}{response.request.url.path} "
+            f"-> {response.status_code} in {seconds * 1000:.0f} ms "
+            f"(handshake {handshake_seconds * 1000:.0f} ms, {response.http_version})"
+        )
+
+        if latency_stats is not None:
+            latency_stats.record(response.request.url.host, seconds, handshake_seconds)
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+    transport = RetryingTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=settings.HTTP2 and h2 is not None),
+        circuit_breakers if circuit_breakers is not None else CircuitBreakers()
+    )
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.TIMEOUT),
+        transport=transport,
+        headers={"Accept-Encoding": ACCEPT_ENCODING},
+        event_hooks={"request": [stamp_request], "response": [log_latency]},
+    )
+
+
+class LMSSession:
+    """
+    One client for everything the task service sends to the HSE servers, kept for the service's
+    whole lifetime so that the connections (and the cookies) are reused between polls
+    """
+    def __init__(
+        self, 
+        latency_stats: LatencyStats | None = None, 
+        circuit_breakers: CircuitBreakers | None = None
+    ):
+        self.latency_stats = latency_stats if latency_stats is not None else LatencyStats()
+        self.circuit_breakers = circuit_breakers if circuit_breakers is not None else CircuitBreakers()
+        self.__client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self.__client is None or self.__client.is_closed:
+            self.__client = create_client(self.latency_stats, self.circuit_breakers)
+
+        return self.__client
+
+    def clear_cookies(self):
+        if self.__client is not None:
+            self.__client.cookies.clear()
+
+    async def aclose(self):
+        if self.__client is not None:
+            await self.__client.aclose()
+            self.__client = None
@@ -1,18 +1,46 @@
-from bs4 import BeautifulSoup, ResultSet, Tag
+from bs4 import BeautifulSoup, ResultSet, SoupStrainer, Tag
 import httpx
 from datetime import datetime
-import dateparser
 import pytz
 from auth import AuthError
-from typing import Iterable
+from deadlineparser import MSK_TIMEZONE, parse_deadline
+from typing import AsyncIterator, Iterable
+from contextlib import aclosing
+from concurrent.futures import Executor
 from model import Token, Task, TaskType
+from lmshttp import RETRY_SAFE, STREAMED_BODY
+from jsonstream import JSONArrayScanner, NotAJSONArrayError
 import asyncio
 import json
 import html
+import hashlib
+import re
+import logging
 from pprint import pprint
+import sys
 
+try:
+    # optional, parses a lot faster than html.parser
+    import lxml
+except ImportError:
+    lxml = None
 
-MSK_TIMEZONE = "Europe/Moscow"
+
+# module fields that change without the task itself changing (e.g. whether the account completed it),
+# these are left out of the content hash
+VOLATILE_MODULE_KEYS = ("completiondata", )
+
+# the deadline is in .generaltable on assignment pages and in .quizinfo on quiz pages,
+# nothing else on the page gets parsed into the tree.
+# the strainer sees the raw class attribute (e.g. "box quizinfo"), hence the regex
+TASK_PAGE_STRAINER = SoupStrainer(class_=re.compile(r"(?:^|\s)(?:generaltable|quizinfo)(?:\s|$)"))
+HTML_PARSER = "lxml" if lxml is not None else "html.parser"
+
+# moodle puts the id first in every course section,
+# so the sections we don't need can be skipped without parsing them
+SECTION_ID_RE = re.compile(r'\s*\{\s*"id"\s*:\s*(-?\d+)\s*[,}]')
+
+logger = logging.getLogger("lms_tasks")
 
 
 class TaskError(Exception):
@@ -24,52 +52,242 @@ class TaskDeserializationError(TaskError):
 class TaskFetchError(TaskError):
     pass
 
+
+def parse_task_page(task_view: str) -> BeautifulSoup:
+    """
+    Parses only the parts of a task page that have the deadline in them
+    """
+    return BeautifulSoup(task_view, features=HTML_PARSER, parse_only=TASK_PAGE_STRAINER)
+
+
+def get_assignment_deadline(soup: BeautifulSoup) -> datetime:
+    DUE_DATE_TEXT = "Due date"
+    deadline = None
+    
+    try:
+        table = soup.select_one(".generaltable")
+        
+        rows = table.select("tr")                   # type: ignore
+        for row in rows:
+            header = row.select_one("th")
+            data = row.select_one("td")
+            
+            if header.text != DUE_DATE_TEXT:        # type: ignore
+                continue
+            
+            deadline = parse_deadline(data.text, MSK_TIMEZONE)     # type: ignore
+            break
+            
+    except (KeyError, TypeError, AttributeError) as e:
+        raise TaskDeserializationError(str(e))
+    
+    if deadline is None:
+        raise TaskDeserializationError("Could not parse the due date")
+    
+    return deadline
+
+
+def get_quiz_deadline(soup: BeautifulSoup) -> datetime:
+    deadline = None
+    
+    try:
+        # this has a similar format to "This quiz closes on Monday, 26 september, 2022"
+        # get the second p element
+        quizinfo = soup.select(".quizinfo p")
+        
+        deadline = get_due_date_from_quizinfo(quizinfo)
+        
+            
+    except (KeyError, TypeError, AttributeError) as e:
+        raise TaskDeserializationError(str(e))
+    
+    if deadline is None:
+        raise TaskDeserializationError("Could not parse the due date")
+    
+    return deadline
+
+
+def get_due_date_from_quizinfo(quizinfo: ResultSet[Tag]) -> datetime | None:
+    deadline = None
+    
+    for tag in reversed(quizinfo):
+        try:
+            line = tag.text
+            due_date_str = line.split(",", 1)[1]    # split after the day of the week
+            
+            deadline = parse_deadline(due_date_str, MSK_TIMEZONE)
+            
+            if deadline is not None:
+                break
+
+        except IndexError:
+            continue
+    
+    return deadline
+
+
+def get_page_deadline(task_view: str, task_type: TaskType) -> datetime:
+    """
+    Gets the deadline from the text of a task page.
+    
+    Doesn't touch the fetcher, so it can be run in a process pool
+    """
+    soup = parse_task_page(task_view)
+    
+    match task_type:
+        case TaskType.QUIZ:
+            return get_quiz_deadline(soup)
+        case TaskType.ASSIGNMENT:
+            return get_assignment_deadline(soup)
+        case _:
+            raise TaskError("Unknown task type")
+
+
+
 class LMSTaskFetcher:
     TASKS_REQUEST_URL = "https://edu.hse.ru/webservice/adfsrest/server.php"
     ASSIGN_VIEW_HOST = "https://edu.hse.ru/mod/assign/view.php"
     QUIZ_VIEW_HOST = "https://edu.hse.ru/mod/quiz/view.php"
     
-    def __init__(self, client: httpx.AsyncClient, course_id: int, submodule_id: int, bearer: Token):
+    def __init__(
+        self, 
+        client: httpx.AsyncClient, 
+        course_id: int, 
+        submodule_id: int, 
+        bearer: Token, 
+        bulk_deadlines: bool = True,
+        max_concurrency: int = 8,
+        executor: Executor | None = None
+    ):
+        """
+        If bulk_deadlines is set, deadlines are gotten for the whole course at once through the web service,
+        task pages are only scraped for the tasks the web service didn't give a deadline for.
+        
+        At most max_concurrency task pages are requested at the same time,
+        the pages are parsed in the executor if it's given and right on the event loop otherwise
+        """
         self.client = client
         self.course_id = course_id
         self.submodule_id = submodule_id
         self.bearer_token = bearer
+        self.bulk_deadlines = bulk_deadlines
+        self.max_concurrency = max_concurrency
+        self.executor = executor
 
-    async def __fetch_tasks_raw(self) -> str:
+    def __webservice_request_args(self, wsfunction: str, params: dict) -> dict:
         form_data = {
-            "wsfunction": "core_course_get_contents",
-            "courseid": self.course_id,
+            "wsfunction": wsfunction,
             "moodlewssettinglang": "en",
             "moodlewsrestformat": "json",
-            "moodlewssettingfilter": True
+            "moodlewssettingfilter": True,
+            **params
         }
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
             "Authorization": f"Bearer {self.bearer_token.value}"
         }
         
+        return {
+            "url": self.TASKS_REQUEST_URL, 
+            "data": form_data, 
+            "headers": headers,
+            # the functions used here only read
+            "extensions": {RETRY_SAFE: True},
+        }
+    
+    async def __call_webservice_raw(self, wsfunction: str, params: dict) -> str:
         try:
-            response = await self.client.post(self.TASKS_REQUEST_URL, data=form_data, headers=headers)
+            response = await self.client.post(**self.__webservice_request_args(wsfunction, params))
             response.raise_for_status()
         except httpx.HTTPError as e:
             raise TaskFetchError(str(e))
         
         return response.text
+    
+    async def __call_webservice(self, wsfunction: str, params: dict) -> dict:
+        raw_response = await self.__call_webservice_raw(wsfunction, params)
         
-    def __deserealize_tasks(self, raw_response: str) -> list[Task]:
+        return self.__load_webservice_response(wsfunction, raw_response)
+    
+    @staticmethod
+    def __load_webservice_response(wsfunction: str, raw_response: str) -> dict:
+        try:
+            response = json.loads(raw_response)
+        except json.JSONDecodeError as e:
+            raise TaskDeserializationError(f"Invalid {wsfunction} response: {e}")
+        
+        # moodle reports errors with a 200 status and an exception object
+        if not isinstance(response, dict) or "exception" in response:
+            message = response.get("message") if isinstance(response, dict) else response
+            raise TaskFetchError(f"{wsfunction} failed: {message}")
+        
+        return response
+
+    async def __iter_course_sections(self) -> AsyncIterator[str]:
+        """
+        Streams core_course_get_contents and yields the JSON text of each course section as soon as it's read,
+        so that the response (which can be megabytes for big courses) is never in memory whole
+        """
+        wsfunction = "core_course_get_contents"
+        scanner = JSONArrayScanner()
+        # only kept if the response isn't a list of sections, i.e. it's most likely an error object
+        not_sections: list[str] | None = None
+        
+        request_args = self.__webservice_request_args(wsfunction, {"courseid": self.course_id})
+        request_args["extensions"][STREAMED_BODY] = True
+        
+        try:
+            async with self.client.stream("POST", **request_args) as response:
+                response.raise_for_status()
+                
+                async for chunk in response.aiter_text():
+                    if not_sections is not None:
+                        not_sections.append(chunk)
+                        continue
+                    
+                    try:
+                        sections = scanner.feed(chunk)
+                    except NotAJSONArrayError:
+                        not_sections = [chunk]
+                        continue
+                    
+                    for section in sections:
+                        yield section
+                        
+        except httpx.HTTPError as e:
+            raise TaskFetchError(str(e))
+        
+        if not_sections is not None:
+            # raises the error moodle reported if there is one
+            self.__load_webservice_response(wsfunction, "".join(not_sections))
+            raise TaskDeserializationError(f"{wsfunction} didn't return a list of sections")
+        
+        if not scanner.finished:
+            raise TaskDeserializationError(f"{wsfunction} response ended unexpectedly")
+    
+    async def __fetch_submodule(self) -> dict:
+        """
+        Finds the course section that corresponds to SMART LMS training submodule,
+        the rest of the course isn't parsed and the response stops being read once it's found
+        """
+        async with aclosing(self.__iter_course_sections()) as sections:
+            async for section_text in sections:
+                section_id = SECTION_ID_RE.match(section_text)
+                if section_id is not None and int(section_id[1]) != self.submodule_id:
+                    continue
+                
+                try:
+                    section = json.loads(section_text)
+                except json.JSONDecodeError as e:
+                    raise TaskDeserializationError(f"Invalid course section: {e}")
+                
+                if isinstance(section, dict) and section.get("id") == self.submodule_id:
+                    return section
+        
+        raise TaskDeserializationError("Task dictionary not found")
+        
+    def __deserealize_tasks(self, lms_training_dict: dict) -> list[Task]:
         try:
-            sub_module_list: list[dict] = json.loads(raw_response)
-            
-            # find the dict that corresponds to SMART LMS training submodule
-            lms_training_dict: dict | None = None
-            for i in sub_module_list:
-                if i["id"] == self.submodule_id:
-                    lms_training_dict = i
-                    break
-            
-            if lms_training_dict is None:
-                raise TaskDeserializationError("Task dictionary not found")
-            
             task_dict_list: list[dict] = lms_training_dict["modules"]
             task_list: list[Task] = []
             
@@ -78,7 +296,14 @@ class LMSTaskFetcher:
                 name = html.unescape(task_dict["name"])
                 task_type = TaskType(task_dict["modname"])
                 
-                task = Task(task_id=task_id, task_type=task_type, name=name)
+                task = Task(
+                    task_id=task_id, 
+                    task_type=task_type, 
+                    name=name, 
+                    content_hash=self.__hash_module(task_dict),
+                    course_id=self.course_id,
+                    section_id=self.submodule_id
+                )
                 task_list.append(task)
             
         except (TypeError, AttributeError, KeyError) as e:
@@ -86,6 +311,13 @@ class LMSTaskFetcher:
         
         return task_list
     
+    @staticmethod
+    def __hash_module(task_dict: dict) -> str:
+        content = {key: value for key, value in task_dict.items() if key not in VOLATILE_MODULE_KEYS}
+        encoded = json.dumps(content, sort_keys=True, ensure_ascii=False).encode()
+        
+        return hashlib.sha1(encoded).hexdigest()
+    
     async def __fetch_task_view(self, task: Task) -> str:
         params = {
             "id": task.task_id,
@@ -112,103 +344,127 @@ class LMSTaskFetcher:
         
         return task_page.text
         
-    def __get_assignment_deadline(self, soup: BeautifulSoup) -> datetime:
-        DUE_DATE_TEXT = "Due date"
-        deadline = None
+    async def get_deadline(self, task: Task) -> datetime:
+        task_view = await self.__fetch_task_view(task)
         
-        try:
-            table = soup.select_one(".generaltable")
-            
-            rows = table.select("tr")                   # type: ignore
-            for row in rows:
-                header = row.select_one("th")
-                data = row.select_one("td")
-                
-                if header.text != DUE_DATE_TEXT:        # type: ignore
-                    continue
-                
-                settings = {
-                    "TIMEZONE": MSK_TIMEZONE,
-                    "RETURN_AS_TIMEZONE_AWARE": True
-                }
-                
-                deadline = dateparser.parse(data.text, settings=settings)          # type: ignore
-                break
-                
-        except (KeyError, TypeError, AttributeError) as e:
-            raise TaskDeserializationError(str(e))
+        if self.executor is None:
+            return get_page_deadline(task_view, task.task_type)
         
-        if deadline is None:
-            raise TaskDeserializationError("Could not parse the due date")
+        # parsing takes long enough to stall the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, get_page_deadline, task_view, task.task_type)
+    
+    async def __get_assignment_deadlines(self) -> dict[int, datetime]:
+        response = await self.__call_webservice(
+            "mod_assign_get_assignments", {"courseids[0]": self.course_id}
+        )
+        deadlines: dict[int, datetime] = {}
         
-        return deadline
+        try:
+            for course in response["courses"]:
+                for assignment in course["assignments"]:
+                    # 0 means there's no due date
+                    if assignment["duedate"]:
+                        deadlines[assignment["cmid"]] = datetime.fromtimestamp(
+                            assignment["duedate"], tz=pytz.timezone(MSK_TIMEZONE)
+                        )
+        except (TypeError, KeyError) as e:
+            raise TaskDeserializationError(f"Error while deserializing assignments: {e}")
         
-    def __get_quiz_deadline(self, soup: BeautifulSoup) -> datetime:
-        deadline = None
+        return deadlines
+    
+    async def __get_quiz_deadlines(self) -> dict[int, datetime]:
+        response = await self.__call_webservice(
+            "mod_quiz_get_quizzes_by_courses", {"courseids[0]": self.course_id}
+        )
+        deadlines: dict[int, datetime] = {}
         
         try:
-            # this has a similar format to "This quiz closes on Monday, 26 september, 2022"
-            # get the second p element
-            quizinfo = soup.select(".quizinfo p")
-            
-            deadline = self.__get_due_date_from_quizinfo(quizinfo)
-            
-                
-        except (KeyError, TypeError, AttributeError) as e:
-            raise TaskDeserializationError(str(e))
+            for quiz in response["quizzes"]:
+                # 0 means the quiz never closes
+                if quiz["timeclose"]:
+                    deadlines[quiz["coursemodule"]] = datetime.fromtimestamp(
+                        quiz["timeclose"], tz=pytz.timezone(MSK_TIMEZONE)
+                    )
+        except (TypeError, KeyError) as e:
+            raise TaskDeserializationError(f"Error while deserializing quizzes: {e}")
         
-        if deadline is None:
-            raise TaskDeserializationError("Could not parse the due date")
-        
-        return deadline
+        return deadlines
     
-    @staticmethod
-    def __get_due_date_from_quizinfo(quizinfo: ResultSet[Tag]) -> datetime | None:
-        deadline = None
+    async def get_course_deadlines(self) -> dict[int, datetime]:
+        """
+        Gets the deadlines of all the assignments and quizzes in the course in two requests.
         
-        for tag in reversed(quizinfo):
-            try:
-                line = tag.text
-                due_date_str = line.split(",", 1)[1]    # split after the day of the week
-                
-                settings = {
-                    "TIMEZONE": MSK_TIMEZONE,
-                    "RETURN_AS_TIMEZONE_AWARE": True
-                }
-                deadline = dateparser.parse(due_date_str, settings=settings)    # type: ignore
-                
-                if deadline is not None:
-                    break
-
-            except IndexError:
+        Returns a dict of task id (course module id) -> deadline,
+        if one of the requests fails the deadlines from the other one are still returned
+        """
+        results = await asyncio.gather(
+            self.__get_assignment_deadlines(),
+            self.__get_quiz_deadlines(),
+            return_exceptions=True
+        )
+        course_deadlines: dict[int, datetime] = {}
+        
+        for result in results:
+            if isinstance(result, TaskError):
+                logger.warning(f"Could not get the deadlines from the web service: {result}")
                 continue
+            
+            if isinstance(result, BaseException):
+                raise result
+            
+            course_deadlines |= result
         
-        return deadline
-    
-    async def get_deadline(self, task: Task) -> datetime:
-        task_view = await self.__fetch_task_view(task)
-        soup = BeautifulSoup(task_view, features="html.parser")
-        
-        match task.task_type:
-            case TaskType.QUIZ:
-                return self.__get_quiz_deadline(soup)
-            case TaskType.ASSIGNMENT:
-                return self.__get_assignment_deadline(soup)
-            case _:
-                raise TaskError("Unknown task type")
+        return course_deadlines
     
     async def add_deadlines(self, task_list: Iterable[Task]):
+        task_list = list(task_list)
+        
+        if self.bulk_deadlines and task_list:
+            course_deadlines = await self.get_course_deadlines()
+            
+            for task in task_list:
+                task.deadline = course_deadlines.get(task.task_id)
+            
+            # falling back to the task pages for whatever the web service didn't have
+            task_list = [task for task in task_list if task.deadline is None]
+            if task_list:
+                logger.info(f"Scraping the deadlines of {len(task_list)} tasks")
+        
+        await self.scrape_deadlines(task_list)
+    
+    async def scrape_deadlines(self, task_list: Iterable[Task]):
+        """
+        Gets the deadlines of the tasks from their pages, one request per task.
+        
+        A page failing doesn't affect the others, the tasks whose deadlines couldn't be gotten
+        are left with deadline set to None
+        """
         # for task in task_list:
         #     deadline = await self.get_deadline(task)
         #     task.deadline = deadline
         
         # doing it through tasks asynchronously coz it's faster
-        # as waiting for each requests doesn't disrupt the program
+        # as waiting for each requests doesn't disrupt the program,
+        # but not all at once so we don't hammer the LMS
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
         async def add_deadline_to_task(task: Task):
-            deadline = await self.get_deadline(task)
+            async with semaphore:
+                deadline = await self.get_deadline(task)
             task.deadline = deadline
-            
-        await asyncio.gather(*(add_deadline_to_task(task) for task in task_list))
+        
+        task_list = list(task_list)
+        results = await asyncio.gather(
+            *(add_deadline_to_task(task) for task in task_list), 
+            return_exceptions=True
+        )
+        
+        for task, result in zip(task_list, results):
+            if isinstance(result, TaskError):
+                logger.warning(f"Could not get the deadline of task {task.task_id}: {result}")
+            elif isinstance(result, BaseException):
+                raise result
             
     async def get_tasks_without_deadlines(self) -> list[Task]:
         """
@@ -217,8 +473,8 @@ class LMSTaskFetcher:
         This is useful if you don't want to know the deadlines right away,
         as getting a deadline requires additional requests which might slow down your application
         """
-        raw_tasks = await self.__fetch_tasks_raw()
-        tasks = self.__deserealize_tasks(raw_tasks)
+        submodule = await self.__fetch_submodule()
+        tasks = self.__deserealize_tasks(submodule)
         
         return tasks
     
@@ -244,8 +500,10 @@ async def main():
     login_start = perf_counter()
     print("Logging into SmartLMS")
     
-    with open("AUTH_CREDENTIALS", "r") as f:
-        username, password = (s.strip() for s in f.readlines())
+    from accountpool import load_credentials
+    
+    # the first account is enough here
+    username, password = load_credentials()[0]
         
     async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
         auther = LMSAuther(client)
@@ -266,7 +524,58 @@ async def main():
         print(dd.astimezone(pytz.timezone("UTC")).timestamp())
         print(datetime.fromtimestamp(dd.timestamp()).timestamp())     
 
+
+def benchmark_parsing(paths: list[str]):
+    """
+    Compares parsing saved task pages whole with html.parser against parse_task_page
+    """
+    from time import perf_counter
+    import tracemalloc
+    
+    RUNS = 20
+    
+    def measure(parse, task_view: str) -> tuple[float, int, BeautifulSoup]:
+        start = perf_counter()
+        for _ in range(RUNS):
+            soup = parse(task_view)
+        seconds = (perf_counter() - start) / RUNS
+        
+        tracemalloc.start()
+        soup = parse(task_view)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        
+        return seconds, peak, soup
+    
+    print(f"parser: {HTML_PARSER}")
+    
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            task_view = f.read()
+        
+        full_seconds, full_peak, full_soup = measure(
+            lambda text: BeautifulSoup(text, features="html.parser"), task_view
+        )
+        seconds, peak, soup = measure(parse_task_page, task_view)
+        
+        # the deadline parsing only looks at these, so they have to come out the same
+        selectors = (".generaltable tr", ".quizinfo p")
+        same = all(
+            [tag.text for tag in full_soup.select(selector)] == [tag.text for tag in soup.select(selector)]
+            for selector in selectors
+        )
+        
+        print(path)
+        print(f"    full:     {full_seconds * 1000:8.2f} ms, peak {full_peak / 1024:8.0f} KiB")
+        print(f"    strained: {seconds * 1000:8.2f} ms, peak {peak / 1024:8.0f} KiB")
+        print(f"    same deadline elements: {same}")
+
+
 if __name__ == "__main__":
+    # benchmarking against saved pages if any are given, e.g. python lmstasks.py assign.html quiz.html
+    if len(sys.argv) > 1:
+        benchmark_parsing(sys.argv[1:])
+    else:
     # try:
         asyncio.run(main())
     # except (AuthError, TaskError) as e:
@@ -0,0 +1,37 @@
+"""
+Measuring how long an event loop gets blocked for
+"""
+import asyncio
+
+
+class LoopLagMonitor:
+    """
+    Sleeps for a fixed interval over and over, the time it wakes up late by
+    is how long something was blocking the event loop
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+
+    def summary(self) -> str:
+        if self.__count == 0:
+            return "no samples"
+
+        return f"avg {self.__total / self.__count * 1000:.1f} ms, max {self.__max * 1000:.1f} ms"
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+
+            self.__count += 1
+            self.__total += lag
+            self.__max = max(self.__max, lag)
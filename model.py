@@ -29,6 +29,11 @@ class Task(BaseModel):
     name: str
     task_type: TaskType
     deadline: datetime | None = None
+    # hash of the module data the task was made from, used to notice when it changes on the LMS
+    content_hash: str | None = None
+    # where the task is on the LMS
+    course_id: int | None = None
+    section_id: int | None = None
     
     def encode(self) -> tuple[int, str, str, float]:
         deadline_timestamp = self.deadline.timestamp() if self.deadline is not None else 0
@@ -48,20 +53,44 @@ class Task(BaseModel):
         return Task(task_id=task_id, name=name, task_type=task_type, deadline=deadline)
 
 
+class DeadlineChange(BaseModel):
+    # with the new deadline
+    task: Task
+    old_deadline: datetime
+    changed_at: datetime
+
+
+class TaskSyncResult(BaseModel):
+    new: list[Task] = []
+    changed: list[DeadlineChange] = []
+    # tasks that have disappeared from the course
+    removed: list[Task] = []
+    # removed tasks that have come back to the course
+    revived: list[Task] = []
+
+
 class User(BaseModel):
     user_id: int
     is_active: bool = True
     remind_interval: timedelta = timedelta(days=1)
+    # all due tasks in one message instead of a message per task
+    digest_mode: bool = False
     
-    def encode(self) -> tuple[int, bool, float]:
-        return (self.user_id, self.is_active, self.remind_interval.total_seconds())
+    def encode(self) -> tuple[int, bool, float, bool]:
+        return (
+            self.user_id, 
+            self.is_active, 
+            self.remind_interval.total_seconds(), 
+            self.digest_mode
+        )
     
     @staticmethod
-    def decode(user_id: int, is_active: bool, remind_seconds: float) -> User:
+    def decode(user_id: int, is_active: bool, remind_seconds: float, digest_mode: bool) -> User:
         return User(
             user_id=user_id, 
             is_active=is_active, 
-            remind_interval=timedelta(seconds=remind_seconds)
+            remind_interval=timedelta(seconds=remind_seconds),
+            digest_mode=digest_mode
         )
     
     
@@ -69,22 +98,32 @@ class ReminderInlineQueryData(BaseModel):
     task_id: int
     # user_id: int      # can be gotten from the query, unnecessary here
     set_active: bool
+    # whether the button is on a digest, None for the buttons sent before this was added
+    is_digest: bool | None = None
     
     def minimized(self) -> str:
-        return ",".join(
-            (
-                str(self.task_id), 
-                # str(self.user_id), 
-                str(int(self.set_active))
-            )
-        )
+        fields = [
+            str(self.task_id), 
+            # str(self.user_id), 
+            str(int(self.set_active))
+        ]
+        if self.is_digest is not None:
+            fields.append(str(int(self.is_digest)))
+        
+        return ",".join(fields)
         
     @staticmethod
     def deminimize(data: str) -> ReminderInlineQueryData | None:
         try:
-            task_id, set_active = (int(i) for i in data.split(","))
-            set_active = bool(set_active)
-            return ReminderInlineQueryData(task_id=task_id, set_active=set_active)
+            task_id, set_active, *is_digest = (int(i) for i in data.split(","))
+            if len(is_digest) > 1:
+                return None
+            
+            return ReminderInlineQueryData(
+                task_id=task_id,
+                set_active=bool(set_active),
+                is_digest=bool(is_digest[0]) if is_digest else None
+            )
         
         except ValueError:
             return None
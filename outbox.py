@@ -0,0 +1,230 @@
+"""
+Rate limited queue for the messages the bot sends on its own (i.e. reminders)
+"""
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from aiogram import Bot, types
+from aiogram.utils import exceptions
+import asyncio
+import itertools
+import logging
+import settings
+
+
+logger = logging.getLogger("outbox")
+logger.setLevel(settings.LOG_LEVEL)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__last_update = asyncio.get_running_loop().time()
+
+    def __refill(self):
+        now = asyncio.get_running_loop().time()
+        self.__tokens = min(self.capacity, self.__tokens + (now - self.__last_update) * self.rate)
+        self.__last_update = now
+
+    def is_full(self) -> bool:
+        self.__refill()
+        return self.__tokens >= self.capacity
+
+    def try_acquire(self) -> float:
+        """
+        Takes a token if there is one and returns 0,
+        otherwise returns the number of seconds until there will be one
+        """
+        self.__refill()
+        if self.__tokens >= 1:
+            self.__tokens -= 1
+            return 0
+
+        return (1 - self.__tokens) / self.rate
+
+    async def acquire(self):
+        # reserving the token right away (the balance can go negative),
+        # so that concurrent callers queue up instead of all waking up at once
+        self.__refill()
+        self.__tokens -= 1
+        if self.__tokens < 0:
+            await asyncio.sleep(-self.__tokens / self.rate)
+
+    def delay(self, seconds: float):
+        """
+        Makes the bucket empty for the next few seconds, used when Telegram tells us to back off
+        """
+        self.__refill()
+        self.__tokens = min(self.__tokens, 0) - seconds * self.rate
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    reply_markup: types.InlineKeyboardMarkup | None = None
+    # messages with lower priority are sent first, reminders use the deadline timestamp
+    priority: float = 0.0
+    # called after the message has been sent
+    on_sent: Callable[[], Awaitable[None]] | None = None
+    # called if sending failed for any reason other than flood control
+    on_error: Callable[[Exception], Awaitable[None]] | None = None
+    retries: int = 0
+
+
+class Outbox:
+    """
+    Priority queue of outgoing messages, sent by a fixed number of workers
+    while keeping under both the global and the per chat Telegram rate limits.
+
+    Messages that hit flood control (RetryAfter) are put back in the queue instead of being dropped
+    """
+    def __init__(
+        self,
+        bot: Bot,
+        worker_count: int = settings.OUTBOX_WORKERS,
+        global_rate: float = settings.OUTBOX_GLOBAL_MESSAGES_PER_SECOND,
+        chat_rate: float = settings.OUTBOX_CHAT_MESSAGES_PER_SECOND,
+        max_size: int = settings.OUTBOX_MAX_SIZE,
+    ):
+        self.bot = bot
+        self.worker_count = worker_count
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.max_size = max_size
+
+        # (priority, insertion order, message), the insertion order breaks ties
+        self.__queue: asyncio.PriorityQueue[tuple[float, int, OutgoingMessage]] = asyncio.PriorityQueue()
+        self.__counter = itertools.count()
+        self.__not_full = asyncio.Event()
+        self.__not_full.set()
+        # messages waiting for their chat's rate limit
+        self.__deferred_count = 0
+        self.__in_flight_count = 0
+        self.__global_bucket: TokenBucket | None = None
+        self.__chat_buckets: dict[int, TokenBucket] = {}
+
+        self.sent_count = 0
+        self.failed_count = 0
+        self.retry_after_count = 0
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize() + self.__deferred_count + self.__in_flight_count
+
+    async def put(self, message: OutgoingMessage):
+        """
+        Puts the message in the queue, waits for the workers to catch up if the queue is full.
+
+        Requeued messages don't count towards the limit, so the workers never have to wait
+        """
+        while self.__queue.qsize() >= self.max_size:
+            self.__not_full.clear()
+            await self.__not_full.wait()
+
+        await self.__queue.put((message.priority, next(self.__counter), message))
+
+    def __requeue_later(self, message: OutgoingMessage, delay: float):
+        def requeue():
+            self.__deferred_count -= 1
+            self.__queue.put_nowait((message.priority, next(self.__counter), message))
+
+        self.__deferred_count += 1
+        asyncio.get_running_loop().call_later(delay, requeue)
+
+    def __get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.__chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, 1)
+            self.__chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    async def __send(self, message: OutgoingMessage):
+        assert self.__global_bucket is not None
+
+        chat_delay = self.__get_chat_bucket(message.chat_id).try_acquire()
+        if chat_delay > 0:
+            # not blocking the worker on a single busy chat
+            self.__requeue_later(message, chat_delay)
+            return
+
+        await self.__global_bucket.acquire()
+
+        try:
+            await self.bot.send_message(
+                message.chat_id,
+                message.text,
+                settings.BOT_MESSAGE_PARSE_MODE,
+                reply_markup=message.reply_markup,
+                disable_web_page_preview=True
+            )
+
+        except exceptions.RetryAfter as e:
+            logger.warning(f"Flood control when sending to {message.chat_id}, retrying in {e.timeout} s")
+            self.retry_after_count += 1
+            message.retries += 1
+            # flood control is applied to the whole bot, so everyone has to wait
+            self.__global_bucket.delay(e.timeout)
+            self.__requeue_later(message, e.timeout)
+            return
+
+        except Exception as e:
+            self.failed_count += 1
+            if message.on_error is None:
+                logger.exception(e)
+                return
+
+            await message.on_error(e)
+            return
+
+        self.sent_count += 1
+        if message.on_sent is not None:
+            await message.on_sent()
+
+    async def __worker(self):
+        while True:
+            _, _, message = await self.__queue.get()
+            if self.__queue.qsize() < self.max_size:
+                self.__not_full.set()
+
+            self.__in_flight_count += 1
+
+            try:
+                await self.__send(message)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self.__in_flight_count -= 1
+                self.__queue.task_done()
+
+    async def __report_stats(self):
+        last_sent_count = self.sent_count
+
+        while True:
+            await asyncio.sleep(settings.OUTBOX_STATS_INTERVAL_SECONDS)
+
+            send_rate = (self.sent_count - last_sent_count) / settings.OUTBOX_STATS_INTERVAL_SECONDS
+            last_sent_count = self.sent_count
+
+            # forgetting the chats that haven't been sent anything in a while
+            self.__chat_buckets = {
+                chat_id: bucket
+                for chat_id, bucket in self.__chat_buckets.items()
+                if not bucket.is_full()
+            }
+
+            logger.info(
+                f"Queue depth: {self.depth}, send rate: {send_rate:.2f} msg/s, "
+                f"sent: {self.sent_count}, failed: {self.failed_count}, "
+                f"flood control hits: {self.retry_after_count}"
+            )
+
+    async def run(self):
+        self.__global_bucket = TokenBucket(self.global_rate, self.global_rate)
+
+        await asyncio.gather(
+            self.__report_stats(),
+            *(self.__worker() for _ in range(self.worker_count)),
+        )
@@ -0,0 +1,107 @@
+"""
+Deciding when each course section should be synced next
+"""
+from datetime import datetime
+from typing import Iterable
+import logging
+import random
+import pytz
+import settings
+
+
+logger = logging.getLogger("poll_scheduler")
+logger.setLevel(settings.LOG_LEVEL)
+
+HOURS_IN_WEEK = 7 * 24
+
+
+def get_hour_of_week(timestamp: float) -> int:
+    # teachers publish tasks on Moscow time
+    time = datetime.fromtimestamp(timestamp, tz=pytz.timezone("Europe/Moscow"))
+
+    return time.weekday() * 24 + time.hour
+
+
+class AdaptivePollScheduler:
+    """
+    Per section poll intervals.
+
+    The interval drops to the minimum when a sync finds changes and grows by backoff_factor
+    every time it doesn't, up to the maximum. The hours of the week changes were seen in before
+    are busy hours, they are polled at most busy_interval apart and the backed off interval
+    never skips over the start of one
+    """
+    def __init__(
+        self,
+        min_interval: float = settings.POLL_MIN_INTERVAL_SECONDS,
+        max_interval: float = settings.POLL_MAX_INTERVAL_SECONDS,
+        busy_interval: float = settings.POLL_BUSY_INTERVAL_SECONDS,
+        initial_interval: float = settings.TASK_SERVICE_INTERVAL_SECONDS,
+        backoff_factor: float = settings.POLL_BACKOFF_FACTOR,
+        jitter: float = settings.POLL_JITTER_FRACTION,
+        busy_hour_min_changes: int = settings.POLL_BUSY_HOUR_MIN_CHANGES,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.busy_interval = busy_interval
+        self.initial_interval = initial_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.busy_hour_min_changes = busy_hour_min_changes
+        self.__intervals: dict[int, float] = {}
+        # section id -> number of changes seen in each hour of the week
+        self.__change_counts: dict[int, list[int]] = {}
+
+    def __get_change_counts(self, section_id: int) -> list[int]:
+        return self.__change_counts.setdefault(section_id, [0] * HOURS_IN_WEEK)
+
+    def add_history(self, section_id: int, change_times: Iterable[float]):
+        """
+        Learns from the times changes were found at before, e.g. loaded from the db on startup
+        """
+        change_counts = self.__get_change_counts(section_id)
+
+        for change_time in change_times:
+            change_counts[get_hour_of_week(change_time)] += 1
+
+    def is_busy_hour(self, section_id: int, timestamp: float) -> bool:
+        change_counts = self.__get_change_counts(section_id)
+
+        return change_counts[get_hour_of_week(timestamp)] >= self.busy_hour_min_changes
+
+    def record_sync(self, section_id: int, changed: bool, now: float):
+        if changed:
+            self.__intervals[section_id] = self.min_interval
+            self.add_history(section_id, (now, ))
+            return
+
+        interval = self.__intervals.get(section_id, self.initial_interval)
+        self.__intervals[section_id] = min(interval * self.backoff_factor, self.max_interval)
+
+    def __seconds_until_busy_hour(self, section_id: int, now: float, within: float) -> float | None:
+        hour_start = now - now % 3600
+
+        # hours are always aligned in the MSK timezone, it has whole hour offsets
+        while (hour_start := hour_start + 3600) < now + within:
+            if self.is_busy_hour(section_id, hour_start):
+                return hour_start - now
+
+        return None
+
+    def next_delay(self, section_id: int, now: float) -> float:
+        """
+        Seconds until the section should be synced again
+        """
+        delay = self.__intervals.get(section_id, self.initial_interval)
+
+        if self.is_busy_hour(section_id, now):
+            delay = min(delay, self.busy_interval)
+
+        # waking up right when a busy hour starts
+        until_busy_hour = self.__seconds_until_busy_hour(section_id, now, delay)
+        if until_busy_hour is not None:
+            delay = until_busy_hour
+
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        return max(delay, self.min_interval)
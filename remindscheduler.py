@@ -0,0 +1,234 @@
+"""
+Keeping track of when each (user, task) pair should be reminded next
+"""
+from model import Task, User
+from datetime import datetime
+import asyncio
+import heapq
+import logging
+import settings
+
+
+logger = logging.getLogger("remind_scheduler")
+logger.setLevel(settings.LOG_LEVEL)
+
+
+class RemindScheduler:
+    """
+    Priority queue of next remind times keyed on last_reminded + remind_interval.
+
+    Stale heap entries are not removed right away, they are skipped when they reach the top
+    (the actual remind time of a pair always lives in the due dict)
+    """
+    def __init__(self):
+        self.__heap: list[tuple[float, int, int]] = []
+        # (user_id, task_id) -> timestamp the pair is due at
+        self.__due: dict[tuple[int, int], float] = {}
+        # (user_id, task_id) -> timestamp of the last reminder, None if never reminded
+        self.__last_reminded: dict[tuple[int, int], float | None] = {}
+        self.__user_tasks: dict[int, set[int]] = {}
+        self.__task_users: dict[int, set[int]] = {}
+        self.__users: dict[int, User] = {}
+        self.__tasks: dict[int, Task] = {}
+        self.__changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.__due)
+
+    def __push(self, user_id: int, task_id: int):
+        key = (user_id, task_id)
+        task = self.__tasks[task_id]
+        last_reminded = self.__last_reminded[key]
+
+        if last_reminded is None:
+            due = 0.0
+        else:
+            due = last_reminded + self.__users[user_id].remind_interval.total_seconds()
+
+        # no point in keeping pairs that won't come due before the deadline
+        if task.deadline is None or due >= task.deadline.timestamp():
+            self.__due.pop(key, None)
+            return
+
+        self.__due[key] = due
+        heapq.heappush(self.__heap, (due, user_id, task_id))
+        self.__changed.set()
+
+    def add(self, user: User, task: Task, last_reminded: datetime | None = None):
+        """
+        Start tracking a reminder (or update the user and the task of a tracked one),
+        a pair that was never reminded about is due right away.
+
+        The later of last_reminded and the remind time already tracked is kept,
+        the db doesn't know about the reminders still on their way or the postponed ones
+        """
+        self.__users[user.user_id] = user
+        self.__tasks[task.task_id] = task
+        self.__user_tasks.setdefault(user.user_id, set()).add(task.task_id)
+        self.__task_users.setdefault(task.task_id, set()).add(user.user_id)
+
+        key = (user.user_id, task.task_id)
+        timestamp = last_reminded.timestamp() if last_reminded is not None else None
+        tracked = self.__last_reminded.get(key)
+        if tracked is not None and (timestamp is None or tracked > timestamp):
+            timestamp = tracked
+
+        self.__last_reminded[key] = timestamp
+        self.__push(user.user_id, task.task_id)
+
+    def remove(self, user_id: int, task_id: int):
+        key = (user_id, task_id)
+        self.__due.pop(key, None)
+        self.__last_reminded.pop(key, None)
+        self.__user_tasks.get(user_id, set()).discard(task_id)
+        self.__task_users.get(task_id, set()).discard(user_id)
+
+    def remove_user(self, user_id: int):
+        for task_id in self.__user_tasks.pop(user_id, set()):
+            key = (user_id, task_id)
+            self.__due.pop(key, None)
+            self.__last_reminded.pop(key, None)
+            self.__task_users.get(task_id, set()).discard(user_id)
+
+        self.__users.pop(user_id, None)
+
+    def remove_task(self, task_id: int):
+        """
+        Stops tracking the reminders of the task for every user, e.g. when it's removed from the course
+        """
+        for user_id in self.__task_users.pop(task_id, set()):
+            key = (user_id, task_id)
+            self.__due.pop(key, None)
+            self.__last_reminded.pop(key, None)
+            self.__user_tasks.get(user_id, set()).discard(task_id)
+
+    def retain(
+        self, keys: set[tuple[int, int]], user_id: int | None = None, task_id: int | None = None
+    ):
+        """
+        Stops tracking the (user_id, task_id) pairs that aren't in keys, out of the pairs of
+        the user or the task if one is given and out of all of them otherwise.
+
+        Used for rebuilding the schedule from the db without losing the in-memory state:
+        the pairs are added again and then the ones the db no longer has are dropped
+        """
+        if user_id is not None:
+            tracked = [(user_id, tracked_task_id) for tracked_task_id in self.__user_tasks.get(user_id, set())]
+        elif task_id is not None:
+            tracked = [(tracked_user_id, task_id) for tracked_user_id in self.__task_users.get(task_id, set())]
+        else:
+            tracked = list(self.__last_reminded)
+
+        for key in tracked:
+            if key not in keys:
+                self.remove(*key)
+
+        if user_id is None and task_id is None:
+            # forgetting the users and the tasks without any reminders left
+            for tracked_user_id in [user for user, tasks in self.__user_tasks.items() if not tasks]:
+                self.__user_tasks.pop(tracked_user_id)
+                self.__users.pop(tracked_user_id, None)
+
+            for tracked_task_id in [task for task, users in self.__task_users.items() if not users]:
+                self.__task_users.pop(tracked_task_id)
+                self.__tasks.pop(tracked_task_id, None)
+
+    def update_user(self, user: User):
+        """
+        Reschedules all the reminders of the user, e.g. after their remind interval has changed
+        """
+        if not user.is_active:
+            self.remove_user(user.user_id)
+            return
+
+        if user.user_id not in self.__users:
+            return
+
+        self.__users[user.user_id] = user
+        for task_id in self.__user_tasks[user.user_id]:
+            self.__push(user.user_id, task_id)
+
+    def postpone(self, user_id: int, task_id: int, delay: float):
+        """
+        Makes the reminder come due again in delay seconds, used when the outbox is overloaded
+        """
+        key = (user_id, task_id)
+        if key not in self.__last_reminded:
+            return
+
+        interval = self.__users[user_id].remind_interval.total_seconds()
+        self.__last_reminded[key] = datetime.now().timestamp() + delay - interval
+        self.__push(user_id, task_id)
+
+    def __pop_due(self, now: float, limit: int | None) -> list[tuple[User, Task]]:
+        due_reminders: list[tuple[User, Task]] = []
+
+        while self.__heap and self.__heap[0][0] <= now:
+            if limit is not None and len(due_reminders) >= limit:
+                break
+
+            due, user_id, task_id = heapq.heappop(self.__heap)
+            key = (user_id, task_id)
+
+            # stale entry, the pair was removed or rescheduled
+            if self.__due.get(key) != due:
+                continue
+
+            user = self.__users[user_id]
+            task = self.__tasks[task_id]
+            # considered reminded from now on, so that it isn't popped again
+            # in case sending the reminder takes a while
+            self.__last_reminded[key] = now
+            self.__due.pop(key)
+            self.__push(user_id, task_id)
+
+            if task.deadline is not None and task.deadline.timestamp() > now:
+                due_reminders.append((user, task))
+
+        return due_reminders
+
+    def __next_due(self) -> float | None:
+        # dropping stale entries so we don't wake up for nothing
+        while self.__heap:
+            due, user_id, task_id = self.__heap[0]
+            if self.__due.get((user_id, task_id)) == due:
+                return due
+
+            heapq.heappop(self.__heap)
+
+        return None
+
+    async def wait_due(
+        self, timeout: float | None = None, limit: int | None = None
+    ) -> list[tuple[User, Task]]:
+        """
+        Sleeps until the earliest reminder comes due and returns the due (user, task) pairs,
+        at most limit of them (the rest are returned by the next calls right away).
+
+        Wakes up early if the schedule changes,
+        returns an empty list if nothing came due within timeout seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+
+        while True:
+            now = datetime.now().timestamp()
+            due_reminders = self.__pop_due(now, limit)
+            if due_reminders:
+                return due_reminders
+
+            self.__changed.clear()
+            next_due = self.__next_due()
+
+            sleep_time = next_due - now if next_due is not None else None
+            if deadline is not None:
+                time_left = deadline - loop.time()
+                if time_left <= 0:
+                    return []
+
+                sleep_time = time_left if sleep_time is None else min(sleep_time, time_left)
+
+            try:
+                await asyncio.wait_for(self.__changed.wait(), sleep_time)
+            except asyncio.TimeoutError:
+                pass
@@ -1,5 +1,6 @@
 from model import Task, User
 from datetime import datetime
+from typing import AsyncIterator, Iterable
 # import sqlite3
 import aiosqlite
 import asyncio
@@ -16,44 +17,72 @@ class RemindService:
     def __init__(self, connection: aiosqlite.Connection):
         self.connection = connection
 
-    async def get_current_reminders(self, user_id: int) -> list[Task]:
+    async def get_reminder_schedule(
+        self, user_id: int | None = None, task_id: int | None = None
+    ) -> list[tuple[User, Task, datetime | None]]:
         """
-        Get all the tasks for this user that they should be reminded about,
-        i.e. the tasks that the user wasn't reminded of in more than the remind interval
+        Get every (user, task) pair that can still be reminded about along with the last remind time
+        (None if never reminded), used to build the RemindScheduler state.
+
+        Gets the pairs of all active users if user_id is None and of all tasks if task_id is None
+        """
+        return [entry async for entry in self.iter_reminder_schedule(user_id, task_id)]
+
+    async def iter_reminder_schedule(
+        self, 
+        user_id: int | None = None, 
+        task_id: int | None = None, 
+        page_size: int = settings.DB_FETCH_PAGE_SIZE
+    ) -> AsyncIterator[tuple[User, Task, datetime | None]]:
         """
-        logger.debug(f"Getting current reminders for user {user_id}")
+        Same as get_reminder_schedule, but streams the rows from the database page by page
+        instead of loading all of them at once
+        """
+        logger.debug(f"Getting reminder schedule for user {user_id}, task {task_id}")
 
-        # THE MONSTROSITY
         async with self.connection.cursor() as cursor:
             await cursor.execute(
                 """--sql
-                SELECT lmstasks.id, name, type, deadline FROM 
-                lmstasks LEFT JOIN reminders 
-                ON lmstasks.id = task_id AND user_id = :user_id
+                SELECT
+                    users.id, users.is_active, users.remind_interval, users.digest_mode,
+                    lmstasks.id, name, type, deadline,
+                    last_reminded
+                FROM
+                reminders
                 JOIN users
-                ON users.id = :user_id
-                
-                WHERE 
+                ON users.id = reminders.user_id
+                JOIN lmstasks
+                ON lmstasks.id = reminders.task_id
+
+                WHERE
+                users.is_active = 1
+                AND
+                (:user_id IS NULL OR users.id = :user_id)
+                AND
+                (:task_id IS NULL OR lmstasks.id = :task_id)
+                AND
+                reminders.is_active = 1   -- not turned off
+                AND
                 deadline > :timestamp_now -- not overdue
                 AND
-                (
-                    last_reminded IS NULL OR last_reminded = '' -- never reminded
-                    OR
-                    (
-                        reminders.is_active = 1   -- not turned off
-                        AND
-                        last_reminded < :timestamp_now - remind_interval
-                        --reminded more than remind_interval seconds ago
-                    )
-                )
+                removed_at IS NULL -- still in the course
+                ORDER BY users.id -- so that only the current user has to be kept around
                 """,
-                {"user_id": user_id, "timestamp_now": datetime.now().timestamp()},
+                {"user_id": user_id, "task_id": task_id, "timestamp_now": datetime.now().timestamp()},
             )
-            result = await cursor.fetchall()
 
-        tasks = [Task.decode(*task_data) for task_data in result]
+            user: User | None = None
 
-        return tasks
+            while rows := await cursor.fetchmany(page_size):
+                for row in rows:
+                    user_data, task_data, last_reminded = row[:4], row[4:8], row[8]
+
+                    if user is None or user.user_id != user_data[0]:
+                        user = User.decode(*user_data)
+
+                    # 0 is the default for the rows that were never reminded
+                    last_reminded_dt = datetime.fromtimestamp(last_reminded) if last_reminded else None
+                    yield (user, Task.decode(*task_data), last_reminded_dt)
 
     async def get_reminded_time(self, task_id: int, user_id: int) -> datetime | None:
         logger.info(f"Getting remind time for task {task_id} for user {user_id}")
@@ -79,13 +108,24 @@ class RemindService:
         """
         logger.info(f"Updating remind time for task {task_id} for user {user_id}")
         
+        await self.set_reminded_times(((task_id, user_id, time), ))
+
+    async def set_reminded_times(self, reminded_times: Iterable[tuple[int, int, datetime]]):
+        """
+        Same as set_reminded_time, but for many (task_id, user_id, time) at once in a single transaction
+        """
         async with self.connection.cursor() as cursor:
-            await cursor.execute(
+            await cursor.executemany(
                 """--sql
-                    REPLACE INTO reminders (task_id, user_id, last_reminded)
-                    VALUES (?, ?, ?);
+                    INSERT INTO reminders (task_id, user_id, last_reminded)
+                    VALUES (:task_id, :user_id, :last_reminded)
+                    ON CONFLICT (task_id, user_id) DO UPDATE SET
+                        last_reminded = excluded.last_reminded;
                 """,
-                (task_id, user_id, time.timestamp()),
+                (
+                    {"task_id": task_id, "user_id": user_id, "last_reminded": time.timestamp()}
+                    for task_id, user_id, time in reminded_times
+                ),
             )
 
         await self.connection.commit()
@@ -126,3 +166,75 @@ class RemindService:
             return None
 
         return Task.decode(*result)
+
+
+class RemindedTimeBuffer:
+    """
+    Write-behind buffer for reminded times.
+
+    Updates are collected in memory and written in one transaction when the buffer fills up
+    or when it's flushed (periodically by run_periodic_flush and on shutdown),
+    so at most max_size rows or max_delay seconds of updates can be lost on a crash
+    """
+    def __init__(
+        self,
+        remind_service: RemindService,
+        max_size: int = settings.REMIND_WRITE_BATCH_SIZE,
+        max_delay: float = settings.REMIND_WRITE_MAX_DELAY_SECONDS,
+    ):
+        self.remind_service = remind_service
+        self.max_size = max_size
+        self.max_delay = max_delay
+
+        # (task_id, user_id) -> time, only the latest update of each pair matters
+        self.__pending: dict[tuple[int, int], datetime] = {}
+        self.__lock = asyncio.Lock()
+
+        self.commit_count = 0
+        self.row_count = 0
+        self.__created_at = datetime.now()
+
+    def __len__(self) -> int:
+        return len(self.__pending)
+
+    async def add(self, task_id: int, user_id: int, time: datetime):
+        self.__pending[(task_id, user_id)] = time
+
+        if len(self.__pending) >= self.max_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.__lock:
+            if not self.__pending:
+                return
+
+            pending = self.__pending
+            self.__pending = {}
+
+            try:
+                await self.remind_service.set_reminded_times(
+                    (task_id, user_id, time) for (task_id, user_id), time in pending.items()
+                )
+            except Exception:
+                # putting them back so that the next flush retries them, newer updates win
+                pending.update(self.__pending)
+                self.__pending = pending
+                raise
+
+            self.commit_count += 1
+            self.row_count += len(pending)
+
+        minutes_running = max((datetime.now() - self.__created_at).total_seconds() / 60, 1)
+        logger.info(
+            f"Flushed {len(pending)} reminded times "
+            f"({self.commit_count} commits, {self.commit_count / minutes_running:.2f} commits/min)"
+        )
+
+    async def run_periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.max_delay)
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception(e)
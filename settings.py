@@ -1,9 +1,50 @@
 TIMEOUT = 30.0
 
+# connection pool of the http clients used for talking to HSE servers
+HTTP_MAX_CONNECTIONS = 10
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 30
+# only used if the h2 package is installed (pip install httpx[http2])
+HTTP2 = True
+# failed requests (connection errors, 429 and 5xx) are retried this many times,
+# waiting a random time up to HTTP_RETRY_BACKOFF_SECONDS * 2^attempt (but at most the max) in between
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF_SECONDS = 0.5
+HTTP_RETRY_MAX_BACKOFF_SECONDS = 10
+# after this many failed requests in a row a host isn't sent requests for CIRCUIT_BREAKER_RESET_SECONDS
+CIRCUIT_BREAKER_FAILURES = 5
+CIRCUIT_BREAKER_RESET_SECONDS = 60
+
 COURSE_ID = 121520
 SUBMODULE_ID = 819742
+# (course id, section id, name shown to the users) of every section the tasks are taken from,
+# section ids are unique across courses so they are what users subscribe to.
+# tasks stored before there could be several sections belong to COURSE_ID, SUBMODULE_ID
+COURSE_SECTIONS = [
+    (COURSE_ID, SUBMODULE_ID, "English"),
+]
+# get the deadlines from the moodle web service (mod_assign_get_assignments, mod_quiz_get_quizzes_by_courses)
+# instead of scraping a page per task, the pages are still scraped if the web service fails
+BULK_DEADLINE_FETCH = True
+# max number of task pages requested at the same time when scraping deadlines
+DEADLINE_FETCH_CONCURRENCY = 8
+# where the scraped task pages are parsed: "process" (a process pool), "thread" (a thread pool)
+# or "inline" (right on the task service event loop)
+PAGE_PARSE_EXECUTOR = "process"
+PAGE_PARSE_WORKERS = 2
+# how often the task service event loop is checked for being blocked
+LOOP_LAG_CHECK_INTERVAL_SECONDS = 0.1
+# known deadlines are re-fetched when the module changes on the LMS, and also every
+# (time until the deadline) * DEADLINE_REVERIFY_FRACTION, but within the min and max
+DEADLINE_REVERIFY_FRACTION = 0.1
+DEADLINE_REVERIFY_MIN_SECONDS = 15 * 60
+DEADLINE_REVERIFY_MAX_SECONDS = 24 * 60 * 60
+# deadlines can get extended after they have passed, so they're checked for a while longer
+DEADLINE_REVERIFY_AFTER_DUE_SECONDS = 7 * 24 * 60 * 60
 
 DB_PATH = "test.db"
+# rows per fetchmany when streaming big result sets
+DB_FETCH_PAGE_SIZE = 500
 
 LOG_FORMAT = "[%(asctime)s] %(name)s:%(levelname)s: %(message)s"
 LOG_DATETIME_FORMAT = "%Y.%m.%d %H:%M:%S"
@@ -11,11 +52,80 @@ LOG_LEVEL = "INFO"
 LOG_FILENAME = "logs.log"
 
 DATETIME_FORMAT = "%A, %d %B %Y, %H:%M"
+# auth tokens are refreshed in the background this long before they expire,
+# failed refreshes are retried every TOKEN_REFRESH_RETRY_SECONDS while the old token is still valid
+TOKEN_REFRESH_MARGIN_SECONDS = 10 * 60
+TOKEN_REFRESH_RETRY_SECONDS = 60
+# the LMS is scraped with every account in AUTH_CREDENTIALS (a username line and a password line each),
+# an account whose credentials the auth server rejects (wrong password, locked) isn't used for this long
+ACCOUNT_DISABLE_SECONDS = 15 * 60
+
 TASK_SERVICE_INTERVAL_SECONDS = 300
-BOT_SERVICE_INTERVAL_SECONDS = 30
+# each section is polled every TASK_SERVICE_INTERVAL_SECONDS at first, the interval drops to the min
+# after a sync finds changes and is multiplied by POLL_BACKOFF_FACTOR after each one that doesn't, up to the max
+POLL_MIN_INTERVAL_SECONDS = 60
+POLL_MAX_INTERVAL_SECONDS = 30 * 60
+POLL_BACKOFF_FACTOR = 1.5
+# the hours of the week that had at least POLL_BUSY_HOUR_MIN_CHANGES changes in the last POLL_HISTORY_DAYS
+# are polled at most POLL_BUSY_INTERVAL_SECONDS apart
+POLL_BUSY_INTERVAL_SECONDS = 120
+POLL_BUSY_HOUR_MIN_CHANGES = 2
+POLL_HISTORY_DAYS = 8 * 7
+# poll intervals are randomly changed by up to this fraction so that the polls don't line up
+POLL_JITTER_FRACTION = 0.1
+# the bot gets the new, changed and removed tasks from the task service's events right away,
+# the reminder schedule is also rebuilt from the db this often in case some events were dropped
+REMIND_SCHEDULER_RELOAD_SECONDS = 60 * 60
+# an event bus subscriber that falls this many events behind starts missing them
+EVENT_BUS_QUEUE_SIZE = 100
+# due reminders are taken from the scheduler in batches of this size
+REMIND_BATCH_SIZE = 1000
+# and handled by this many workers
+REMIND_WORKERS = 16
+
+# reminded times are written in batches of at most this many rows
+REMIND_WRITE_BATCH_SIZE = 500
+# and at least this often, i.e. this is the most that can be lost on a crash
+REMIND_WRITE_MAX_DELAY_SECONDS = 5
 
 BOT_MESSAGE_PARSE_MODE = "HTML"
-MIN_REMIND_INTERVAL_SECONDS = 60
+# how the bot gets its updates: "polling" (a long getUpdates request, BotService.run_bot)
+# or "webhook" (Telegram POSTs them to a local aiohttp server, BotService.run_webhook)
+BOT_UPDATE_MODE = "polling"
+# the public https url Telegram sends the updates to, e.g. a reverse proxy in front of WEBHOOK_HOST:WEBHOOK_PORT,
+# WEBHOOK_PATH is added to both
+WEBHOOK_URL = "https://example.com"
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8080
+# updates handled at the same time, the ones above the limit wait for their turn
+WEBHOOK_MAX_CONCURRENT_UPDATES = 40
+# longer digests are split into several messages
+# so that they stay under Telegram's message length limit
+DIGEST_MAX_TASKS = 10
 
+# reminders are sent through a rate limited queue,
+# Telegram allows about 30 messages per second overall and about 1 per second to the same chat
+OUTBOX_WORKERS = 8
+OUTBOX_GLOBAL_MESSAGES_PER_SECOND = 25
+OUTBOX_CHAT_MESSAGES_PER_SECOND = 1
+OUTBOX_STATS_INTERVAL_SECONDS = 60
+# putting reminders into a full outbox waits until there is space
+OUTBOX_MAX_SIZE = 5000
+# load shedding, reminders of tasks due within this time are always sent as is
+OUTBOX_URGENT_SECONDS = 6 * 60 * 60
+# when there are more messages waiting than this, the rest are coalesced into digests
+OUTBOX_COALESCE_BACKLOG = 200
+# and past this they are postponed for a while
+OUTBOX_DEFER_BACKLOG = 1000
+OUTBOX_DEFER_SECONDS = 15 * 60
+# reminders that couldn't be sent (other than to the users who blocked the bot) are tried again after this
+REMIND_RETRY_SECONDS = 30
+MIN_REMIND_INTERVAL_SECONDS = 60
 
-LOOP_SLEEP_TIME = 10
\ No newline at end of file
+# the task service and the bot run as supervised tasks on one event loop,
+# a component that fails is restarted after a backoff that doubles with every failure in a row,
+# it starts over from the min once the component has run for SUPERVISOR_STABLE_SECONDS
+SUPERVISOR_MIN_BACKOFF_SECONDS = 1
+SUPERVISOR_MAX_BACKOFF_SECONDS = 5 * 60
+SUPERVISOR_STABLE_SECONDS = 10 * 60
@@ -0,0 +1,96 @@
+"""
+Running the long lived parts of the app as asyncio tasks and restarting them when they fail
+"""
+from typing import Awaitable, Callable
+import asyncio
+import logging
+import random
+import settings
+
+
+logger = logging.getLogger("supervisor")
+logger.setLevel(settings.LOG_LEVEL)
+
+Component = Callable[[], Awaitable[None]]
+
+
+class Supervisor:
+    """
+    Every component is meant to run until the app is stopped. When one fails (or returns)
+    it's started again after a delay that doubles with every failure in a row, up to max_backoff.
+    A component that ran for stable_seconds before failing starts over from min_backoff
+    """
+    def __init__(
+        self,
+        min_backoff: float = settings.SUPERVISOR_MIN_BACKOFF_SECONDS,
+        max_backoff: float = settings.SUPERVISOR_MAX_BACKOFF_SECONDS,
+        stable_seconds: float = settings.SUPERVISOR_STABLE_SECONDS,
+    ):
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_seconds = stable_seconds
+        self.__components: dict[str, Component] = {}
+        self.__stopping = asyncio.Event()
+        self.restart_counts: dict[str, int] = {}
+
+    def add(self, name: str, component: Component):
+        """
+        component is called again for every restart, so it has to make a fresh coroutine each time
+        """
+        self.__components[name] = component
+        self.restart_counts[name] = 0
+
+    def stop(self):
+        logger.info("Stopping")
+        self.__stopping.set()
+
+    async def __supervise(self, name: str, component: Component):
+        loop = asyncio.get_running_loop()
+        backoff = self.min_backoff
+
+        while True:
+            started_at = loop.time()
+            logger.info(f"Starting {name}")
+
+            try:
+                await component()
+
+                if not self.__stopping.is_set():
+                    logger.warning(f"{name} stopped on its own")
+            except Exception as e:
+                logger.error(f"{name} failed")
+                logger.exception(e)
+
+            # some components return instead of raising when they're cancelled,
+            # they aren't restarted once the app is stopping
+            if self.__stopping.is_set():
+                return
+
+            if loop.time() - started_at >= self.stable_seconds:
+                backoff = self.min_backoff
+
+            # so that a few components failing together don't all come back at the same moment
+            delay = random.uniform(backoff / 2, backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+            self.restart_counts[name] += 1
+
+            logger.info(f"Restarting {name} in {delay:.1f} s")
+            await asyncio.sleep(delay)
+
+    async def run(self):
+        """
+        Runs the components until stop is called, then cancels them and waits for them to finish
+        """
+        tasks = [
+            asyncio.create_task(self.__supervise(name, component), name=name)
+            for name, component in self.__components.items()
+        ]
+
+        try:
+            await self.__stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info("All components stopped")
@@ -1,36 +1,112 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Iterable
-from lmstasks import LMSTaskFetcher, TaskError
-from model import Token, Task
-from auth import LMSAuther, AuthError
+from lmstasks import LMSTaskFetcher, TaskError, TaskFetchError
+from model import DeadlineChange, TaskSyncResult, Token, Task
+from accountpool import AccountPool, LMSAccount, load_credentials
+from lmshttp import CircuitBreakers, LatencyStats
+from pollscheduler import AdaptivePollScheduler
+from eventbus import EventBus
+import httpx
+from loopmonitor import LoopLagMonitor
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from functools import partial
 from pprint import pformat
 # import sqlite3
 import aiosqlite
 import settings
 import asyncio
-import httpx
 import logging
+import multiprocessing
 
 
 logger = logging.getLogger("task_service")
 logger.setLevel(settings.LOG_LEVEL)
 
 
+def create_parse_executor(kind: str, workers: int) -> Executor | None:
+    """
+    Makes the executor the task pages are parsed in, None means parsing on the event loop
+    """
+    match kind:
+        case "process":
+            # aiosqlite runs the db in another thread, forking with threads running can deadlock
+            return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        case "thread":
+            return ThreadPoolExecutor(workers, thread_name_prefix="page_parser")
+        case "inline":
+            return None
+        case _:
+            raise ValueError(f"Unknown page parse executor: {kind}")
+
+
 class LMSTaskService:
-    def __init__(self, db_connection: aiosqlite.Connection, username: str, password: str):
+    def __init__(
+        self, 
+        db_connection: aiosqlite.Connection, 
+        credentials: list[tuple[str, str]],
+        task_events: EventBus[TaskSyncResult] | None = None
+    ):
+        """
+        credentials are the (username, password) of every account the LMS is scraped with,
+        the result of every sync that found something is published to task_events
+        """
         self.connection = db_connection
-        self.username = username
-        self.password = password
+        self.task_events = task_events
+        self.latency_stats = LatencyStats()
+        self.circuit_breakers = CircuitBreakers()
+        # every account keeps one session for the whole lifetime of the service,
+        # the db only keeps the tokens for after a restart
+        self.accounts = AccountPool([
+            LMSAccount(
+                username, 
+                password, 
+                self.__get_token_from_db, 
+                self.__store_token, 
+                self.latency_stats, 
+                self.circuit_breakers
+            )
+            for username, password in credentials
+        ])
+        self.loop_lag = LoopLagMonitor(settings.LOOP_LAG_CHECK_INTERVAL_SECONDS)
+        self.parse_executor = create_parse_executor(
+            settings.PAGE_PARSE_EXECUTOR, settings.PAGE_PARSE_WORKERS
+        )
+    
+    async def close(self):
+        await self.accounts.close()
+        
+        if self.parse_executor is not None:
+            # waiting for the workers to exit blocks, so it's done off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, partial(self.parse_executor.shutdown, cancel_futures=True)
+            )
     
-    async def __get_token_from_db(self, title: str) -> Token | None:
+    def __replace_parse_executor(self, broken_executor: Executor | None):
+        """
+        A process pool is unusable for good once one of its workers dies (e.g. killed for using too much memory).
+        Several syncs can run into the same broken pool, it's only replaced once
+        """
+        if broken_executor is not self.parse_executor:
+            return
+        
+        logger.warning("The page parse executor is broken, starting a new one.")
+        
+        if broken_executor is not None:
+            broken_executor.shutdown(wait=False, cancel_futures=True)
+        
+        self.parse_executor = create_parse_executor(
+            settings.PAGE_PARSE_EXECUTOR, settings.PAGE_PARSE_WORKERS
+        )
+    
+    async def __get_token_from_db(self, account: str, title: str) -> Token | None:
         async with self.connection.cursor() as cursor:
             await cursor.execute(
                 """--sql
                     SELECT title, value, expiration_dt FROM tokens 
-                    WHERE title=? AND expiration_dt > ?;
+                    WHERE account=? AND title=? AND expiration_dt > ?;
                 """,
-                (title, datetime.now().timestamp())
+                (account, title, datetime.now().timestamp())
             )
         
             result = await cursor.fetchone()
@@ -40,102 +116,193 @@ class LMSTaskService:
         
         return Token.decode(*result)
     
-    async def __get_msis_from_auth(self) -> Token | None:
-        func = partial(LMSAuther.get_msisauth_token, username=self.username, password=self.password)
-        
-        return await self.__call_from_auth(func)
-            
-    async def __get_bearer_from_auth(self, msis: Token) -> Token | None:
-        func = partial(LMSAuther.get_bearer_token, msisauth_token=msis)
-        
-        return await self.__call_from_auth(func)
-    
-    async def __call_from_auth(self, func: partial):
-        async with httpx.AsyncClient(timeout=httpx.Timeout(settings.TIMEOUT)) as client:
-            auther = LMSAuther(client)
-            
-            try:
-                return await func(self=auther)
-            except AuthError:
-                return None
-    
-    async def __store_token(self, token: Token):
+    async def __store_token(self, account: str, token: Token):
         async with self.connection.cursor() as cursor:
             await cursor.execute(
                 """--sql
-                    REPLACE INTO tokens(title, value, expiration_dt)
-                    VALUES (?, ?, ?);
+                    REPLACE INTO tokens(account, title, value, expiration_dt)
+                    VALUES (?, ?, ?, ?);
                 """,
-                token.encode()
+                (account, *token.encode())
             )
         
         await self.connection.commit()
     
     async def __store_tasks(self, tasks: Iterable[Task]):
+        """
+        Stores freshly fetched tasks, i.e. also marks their deadlines as verified
+        """
+        verified_at = datetime.now().timestamp()
+        
         async with self.connection.cursor() as cursor:
             await cursor.executemany(
                 """--sql
-                    REPLACE INTO lmstasks(id, name, type, deadline)
-                    VALUES (?, ?, ?, ?);
+                    INSERT INTO lmstasks(
+                        id, name, type, deadline, content_hash, last_verified, course_id, section_id
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        name = excluded.name,
+                        type = excluded.type,
+                        deadline = excluded.deadline,
+                        content_hash = excluded.content_hash,
+                        last_verified = excluded.last_verified,
+                        removed_at = NULL,
+                        course_id = excluded.course_id,
+                        section_id = excluded.section_id;
+                """,
+                (
+                    (*task.encode(), task.content_hash or "", verified_at, task.course_id, task.section_id) 
+                    for task in tasks
+                )
+            )
+            # every user subscribed to the section gets a reminder row for the task
+            await cursor.executemany(
+                """--sql
+                    INSERT OR IGNORE INTO reminders(task_id, user_id)
+                    SELECT ?, user_id FROM subscriptions
+                    WHERE section_id = ?;
                 """,
-                (task.encode() for task in tasks)
+                ((task.task_id, task.section_id) for task in tasks)
             )
         
         await self.connection.commit()
     
-    async def get_msis(self) -> Token | None:
-        # try getting from db
-        logger.info("Getting MSISAuth token.")
-        logger.info("Getting MSISAuth token from the database.")
-        db_msis = await self.__get_token_from_db("MSISAuth")
-        
-        if db_msis is not None:
-            logger.info("MSISAuth token gotten successfully.")
-            return db_msis
-        
-        # if no tokens in db get send a request
-        logger.info("Valid MSISAuth not found in the database. Requesting a new one.")
-        msis = await self.__get_msis_from_auth()
-        
-        if msis is None:
-            logger.warning("Could not get MSISAuth token.")
-            return None
+    async def __store_deadline_changes(self, changes: Iterable[DeadlineChange]):
+        async with self.connection.cursor() as cursor:
+            await cursor.executemany(
+                """--sql
+                    INSERT INTO deadline_changes(task_id, old_deadline, new_deadline, changed_at)
+                    VALUES (?, ?, ?, ?);
+                """,
+                (
+                    (
+                        change.task.task_id,
+                        change.old_deadline.timestamp(),
+                        change.task.deadline.timestamp() if change.task.deadline is not None else 0,
+                        change.changed_at.timestamp()
+                    )
+                    for change in changes
+                )
+            )
         
-        logger.info("MSISAuth token gotten successfully.")
-        logger.info("Saving the MSISAuth token.")
+        await self.connection.commit()
+    
+    async def __tombstone_tasks(self, section_id: int, task_ids: Iterable[int]):
+        """
+        Marks the tasks as removed from the section, they are kept in the db but aren't reminded about
+        """
+        async with self.connection.cursor() as cursor:
+            await cursor.executemany(
+                """--sql
+                    UPDATE lmstasks SET removed_at = ?
+                    -- the task could've moved to another section in the meantime
+                    WHERE id = ? AND section_id = ? AND removed_at IS NULL;
+                """,
+                ((datetime.now().timestamp(), task_id, section_id) for task_id in task_ids)
+            )
         
-        await self.__store_token(msis)
-        return msis
+        await self.connection.commit()
     
-    async def get_bearer(self) -> Token | None:
-        logger.info("Getting Bearer token.")
-        logger.info("Getting Bearer token from the database.")
+    async def __get_stored_task_states(self, section_id: int) -> dict[int, tuple[Task, float, bool]]:
+        """
+        Gets the stored tasks of the section (with their content hashes),
+        when their deadlines were last verified and whether they were removed from the course
+        """
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    SELECT id, name, type, deadline, content_hash, last_verified, removed_at 
+                    FROM lmstasks
+                    WHERE section_id = ?;
+                """,
+                (section_id, )
+            )
+            result = await cursor.fetchall()
         
-        db_bearer = await self.__get_token_from_db("Bearer")
-        if db_bearer is not None:
-            logger.info("Bearer token gotten successfully")
-            return db_bearer
+        states: dict[int, tuple[Task, float, bool]] = {}
+        for *task_data, content_hash, last_verified, removed_at in result:
+            task = Task.decode(*task_data)
+            task.content_hash = content_hash
+            task.section_id = section_id
+            states[task.task_id] = (task, last_verified, removed_at is not None)
         
-        logger.info("Valid Bearer token not found in the database. Requesting a new one.")
+        return states
+    
+    async def __store_section_change(self, section_id: int, changed_at: datetime):
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    INSERT INTO section_changes(section_id, changed_at)
+                    VALUES (?, ?);
+                """,
+                (section_id, changed_at.timestamp())
+            )
         
-        msis = await self.get_msis()
+        await self.connection.commit()
+    
+    async def get_section_change_times(self, since: datetime) -> dict[int, list[float]]:
+        """
+        Gets the timestamps of the syncs that found changes, by section id
+        """
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    SELECT section_id, changed_at FROM section_changes
+                    WHERE changed_at > ?;
+                """,
+                (since.timestamp(), )
+            )
+            result = await cursor.fetchall()
         
-        if msis is None:
-            logger.warning("Could not get Bearer token")
-            return None
+        change_times: dict[int, list[float]] = {}
+        for section_id, changed_at in result:
+            change_times.setdefault(section_id, []).append(changed_at)
         
-        bearer = await self.__get_bearer_from_auth(msis)
+        return change_times
+    
+    @staticmethod
+    def needs_reverification(task: Task, last_verified: float, now: float) -> bool:
+        """
+        The closer the deadline the more often it's checked for changes
+        """
+        deadline = task.deadline.timestamp() if task.deadline is not None else 0
+        time_left = deadline - now
         
-        if bearer is None:
-            logger.warning("Could not get Bearer token")
-            return None
+        if time_left < -settings.DEADLINE_REVERIFY_AFTER_DUE_SECONDS:
+            return False
         
-        logger.info("Bearer token gotten successfully")
-        logger.info("Saving the Bearer token into the database")
+        interval = min(
+            max(time_left * settings.DEADLINE_REVERIFY_FRACTION, settings.DEADLINE_REVERIFY_MIN_SECONDS),
+            settings.DEADLINE_REVERIFY_MAX_SECONDS
+        )
         
-        await self.__store_token(bearer)
+        return now - last_verified >= interval
+    
+    async def get_deadline_changes(self, since: datetime) -> list[DeadlineChange]:
+        logger.info(f"Getting deadline changes since {since}")
         
-        return bearer
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    SELECT lmstasks.id, name, type, deadline, old_deadline, changed_at
+                    FROM deadline_changes JOIN lmstasks
+                    ON lmstasks.id = task_id
+                    WHERE changed_at > ?
+                    ORDER BY changed_at;
+                """,
+                (since.timestamp(), )
+            )
+            result = await cursor.fetchall()
+        
+        return [
+            DeadlineChange(
+                task=Task.decode(*task_data),
+                old_deadline=datetime.fromtimestamp(old_deadline),
+                changed_at=datetime.fromtimestamp(changed_at)
+            )
+            for *task_data, old_deadline, changed_at in result
+        ]
     
     async def get_stored_tasks(self) -> list[Task]:
         logger.info("Getting tasks from the database")
@@ -155,39 +322,193 @@ class LMSTaskService:
         """
         Reuquest new tasks from the LMS server, store them in the database and return them
         """
+        result = await self.sync_tasks()
+        
+        return result.new
+    
+    async def sync_tasks(
+        self, sections: Iterable[tuple[int, int, str]] = settings.COURSE_SECTIONS
+    ) -> TaskSyncResult:
+        """
+        Request the tasks of the sections (course id, section id, name) from the LMS server, 
+        get the deadlines of the new ones and re-check the deadlines of the known ones 
+        that changed or haven't been checked in a while.
+        
+        The sections are synced concurrently, each with the least loaded account.
+        Stores everything in the database and returns the new tasks and the deadline changes
+        """
         logger.info("Getting new tasks.")
-        bearer = await self.get_bearer()
-        if bearer is None:
-            return []
-        
-        old_tasks = await self.get_stored_tasks()
-        old_task_ids = {task.task_id for task in old_tasks}
-        
-        logger.info("Requesting new tasks.")
-        async with httpx.AsyncClient(timeout=httpx.Timeout(settings.TIMEOUT)) as client:
-            fetcher = LMSTaskFetcher(client, settings.COURSE_ID, settings.SUBMODULE_ID, bearer)
-            try:
-                tasks_without_deadlines = await fetcher.get_tasks_without_deadlines()
-                new_tasks = [
-                    task for task in tasks_without_deadlines 
-                    if task.task_id not in old_task_ids
-                ]
-                await fetcher.add_deadlines(new_tasks)
+        self.latency_stats.reset()
+        self.loop_lag.reset()
+        results = await asyncio.gather(
+            *(
+                self.__sync_section_with_failover(course_id, section_id, name)
+                for course_id, section_id, name in sections
+            )
+        )
+        
+        logger.info(f"Request latency: {self.latency_stats.summary()}")
+        logger.info(f"Circuit breakers: {self.circuit_breakers.summary()}")
+        logger.info(f"Accounts: {self.accounts.summary()}")
+        # only measured while the monitor is running, see app.run_app
+        logger.info(f"Event loop lag while fetching: {self.loop_lag.summary()}")
+        
+        sync_result = TaskSyncResult(
+            new=[task for result in results for task in result.new],
+            changed=[change for result in results for change in result.changed],
+            removed=[task for result in results for task in result.removed],
+            revived=[task for result in results for task in result.revived],
+        )
+        
+        if self.task_events is not None and (
+            sync_result.new or sync_result.changed or sync_result.removed or sync_result.revived
+        ):
+            # everything is in the db already, so the subscribers can read it
+            self.task_events.publish(sync_result)
+        
+        return sync_result
+    
+    async def __sync_section_with_failover(self, course_id: int, section_id: int, name: str) -> TaskSyncResult:
+        """
+        Moves on to the next account when the credentials of one are rejected or it can't get the tasks,
+        if the auth server can't be reached the section is skipped until the next sync
+        """
+        for account in self.accounts.candidates():
+            with self.accounts.use(account):
+                bearer = await account.get_bearer()
+                
+                if bearer is None and account.credentials_rejected:
+                    self.accounts.disable(account)
+                    continue
                 
-            except TaskError as e:
-                logger.warning("Could not get new tasks")
-                logger.exception(e)
-                return []
+                if bearer is None:
+                    # the other accounts log in through the same server, the circuit breaker handles the outage
+                    logger.warning(f"Auth server unavailable, skipping section {name} until the next sync.")
+                    return TaskSyncResult()
+                
+                try:
+                    return await self.__sync_section(
+                        account.session.client, bearer, course_id, section_id, name
+                    )
+                except TaskFetchError as e:
+                    logger.warning(
+                        f"Could not get the tasks from section {name} as {account.username}: {e}"
+                    )
+        
+        logger.error(f"No account could sync section {name}.")
+        return TaskSyncResult()
+    
+    async def __sync_section(
+        self, client: httpx.AsyncClient, bearer: Token, course_id: int, section_id: int, name: str
+    ) -> TaskSyncResult:
+        old_tasks = await self.__get_stored_task_states(section_id)
+        now = datetime.now().timestamp()
+        
+        logger.info(f"Requesting new tasks from section {name} ({course_id}/{section_id}).")
+        parse_executor = self.parse_executor
+        fetcher = LMSTaskFetcher(
+            client, 
+            course_id, 
+            section_id, 
+            bearer, 
+            settings.BULK_DEADLINE_FETCH,
+            settings.DEADLINE_FETCH_CONCURRENCY,
+            parse_executor
+        )
+        try:
+            tasks_without_deadlines = await fetcher.get_tasks_without_deadlines()
+            new_tasks: list[Task] = []
+            tasks_to_verify: list[Task] = []
+            
+            for task in tasks_without_deadlines:
+                if task.task_id not in old_tasks:
+                    new_tasks.append(task)
+                    continue
+                
+                old_task, last_verified, is_removed = old_tasks[task.task_id]
+                if (
+                    is_removed    # came back to the course, storing it brings it back to life
+                    or task.content_hash != old_task.content_hash 
+                    or self.needs_reverification(old_task, last_verified, now)
+                ):
+                    tasks_to_verify.append(task)
+            
+            await fetcher.add_deadlines(new_tasks + tasks_to_verify)
+            
+            # whatever didn't get a deadline isn't stored, so it's tried again on the next sync
+            failed_count = sum(task.deadline is None for task in new_tasks + tasks_to_verify)
+            if failed_count > 0:
+                logger.warning(f"Could not get {failed_count} deadlines in section {name}, will retry next sync")
+            
+            new_tasks = [task for task in new_tasks if task.deadline is not None]
+            tasks_to_verify = [task for task in tasks_to_verify if task.deadline is not None]
+            
+        except TaskFetchError:
+            # another account might get through
+            raise
+        except BrokenProcessPool as e:
+            # nothing is stored, so the whole section is tried again next sync
+            logger.warning(f"Could not parse the task pages of section {name}: {e}")
+            self.__replace_parse_executor(parse_executor)
+            return TaskSyncResult()
+        except TaskError as e:
+            logger.warning(f"Could not get new tasks from section {name}")
+            logger.exception(e)
+            return TaskSyncResult()
         
         if len(new_tasks) > 0:
-            logger.info(f"Gotten {len(new_tasks)} new tasks successfully.")
+            logger.info(f"Gotten {len(new_tasks)} new tasks from section {name} successfully.")
             logger.info(pformat(new_tasks))
         else:
-            logger.info(f"No new tasks available.")
+            logger.info(f"No new tasks available in section {name}.")
+        
+        changes: list[DeadlineChange] = []
+        changed_at = datetime.now()
+        
+        for task in tasks_to_verify:
+            old_deadline = old_tasks[task.task_id][0].deadline
+            
+            if old_deadline is None or task.deadline is None:
+                continue
+            
+            if task.deadline.timestamp() != old_deadline.timestamp():
+                changes.append(
+                    DeadlineChange(task=task, old_deadline=old_deadline, changed_at=changed_at)
+                )
+        
+        logger.info(f"Re-verified {len(tasks_to_verify)} deadlines, {len(changes)} of them changed.")
+        if len(changes) > 0:
+            logger.info(pformat(changes))
+        
+        revived_tasks = [task for task in tasks_to_verify if old_tasks[task.task_id][2]]
+        if len(revived_tasks) > 0:
+            logger.info(f"{len(revived_tasks)} removed tasks came back to section {name}.")
+            logger.info(pformat(revived_tasks))
+        
+        await self.__store_tasks(new_tasks + tasks_to_verify)
+        await self.__store_deadline_changes(changes)
+        
+        # set difference between the stored live tasks and the ones currently in the course
+        fetched_task_ids = {task.task_id for task in tasks_without_deadlines}
+        removed_tasks = [
+            task for task, _, is_removed in old_tasks.values()
+            if not is_removed and task.task_id not in fetched_task_ids
+        ]
         
-        await self.__store_tasks(new_tasks)
+        if len(removed_tasks) > 0 and len(fetched_task_ids) == 0:
+            # more likely to be a glitch on the LMS side than everything actually getting deleted
+            logger.warning(f"Section {name} has no tasks at all, not marking any tasks as removed.")
+            removed_tasks = []
         
-        return new_tasks
+        if len(removed_tasks) > 0:
+            logger.info(f"{len(removed_tasks)} tasks were removed from section {name}.")
+            logger.info(pformat(removed_tasks))
+            await self.__tombstone_tasks(section_id, (task.task_id for task in removed_tasks))
+        
+        if new_tasks or changes or removed_tasks or revived_tasks:
+            await self.__store_section_change(section_id, changed_at)
+        
+        return TaskSyncResult(new=new_tasks, changed=changes, removed=removed_tasks, revived=revived_tasks)
         
     async def get_active_stored_tasks(self) -> list[Task]:
         logger.info("Getting active stored tasks.")
@@ -196,7 +517,7 @@ class LMSTaskService:
             await cursor.execute(
                 """--sql
                     SELECT id, name, type, deadline FROM lmstasks
-                    WHERE deadline > ?;
+                    WHERE deadline > ? AND removed_at IS NULL;
                 """,
                 (datetime.now().timestamp(), )
             )
@@ -204,30 +525,42 @@ class LMSTaskService:
         tasks = [Task.decode(*task_data) for task_data in result]
         
         return tasks
-
-
-def task_service_worker():
-    """
-    Task service worker for running in a separate thread
-    """
-    async def main_coroutine():
-        async def run_loop():
-            try:
-                while True:
-                    await service.get_new_tasks()
-                    await asyncio.sleep(settings.TASK_SERVICE_INTERVAL_SECONDS)
-                
-            except Exception as e:
-                logger.exception(e)
+    
+    async def run(self):
+        """
+        Syncs the sections forever, each one when the poll scheduler says it's due
+        """
+        scheduler = AdaptivePollScheduler()
+        history_since = datetime.now() - timedelta(days=settings.POLL_HISTORY_DAYS)
         
-        with open("AUTH_CREDENTIALS", "r", encoding="utf-8") as f:
-            username, password = (s.strip() for s in f.readlines())
+        for section_id, change_times in (await self.get_section_change_times(history_since)).items():
+            scheduler.add_history(section_id, change_times)
         
-        async with aiosqlite.connect(settings.DB_PATH) as connection:
-            service = LMSTaskService(connection, username, password)
-            await run_loop()
-    
-    asyncio.run(main_coroutine())
+        # section id -> timestamp of the next sync
+        next_syncs = {section_id: 0.0 for _, section_id, _ in settings.COURSE_SECTIONS}
+        
+        while True:
+            now = datetime.now().timestamp()
+            due_sections = [
+                section for section in settings.COURSE_SECTIONS if next_syncs[section[1]] <= now
+            ]
+            
+            # the sections that come due together are synced together
+            result = await self.sync_tasks(due_sections)
+            changed_sections = (
+                {task.section_id for task in result.new + result.removed + result.revived}
+                | {change.task.section_id for change in result.changed}
+            )
+            
+            now = datetime.now().timestamp()
+            for _, section_id, name in due_sections:
+                scheduler.record_sync(section_id, section_id in changed_sections, now)
+                delay = scheduler.next_delay(section_id, now)
+                next_syncs[section_id] = now + delay
+                logger.info(f"Syncing section {name} again in {delay:.0f} s.")
+            
+            next_sync = min(next_syncs.values(), default=now + settings.TASK_SERVICE_INTERVAL_SECONDS)
+            await asyncio.sleep(max(next_sync - now, 0))
 
 
 async def main():
@@ -238,12 +571,11 @@ async def main():
         datefmt=settings.LOG_DATETIME_FORMAT
     )
     
-    with open("AUTH_CREDENTIALS", "r") as f:
-        username, password = (s.strip() for s in f.readlines())
+    credentials = load_credentials()
         
     async with aiosqlite.connect("test.db") as connection:
         
-        service = LMSTaskService(connection, username, password)
+        service = LMSTaskService(connection, credentials)
         print("stored")
         pprint(await service.get_stored_tasks())
         
@@ -251,6 +583,7 @@ async def main():
         pprint(await service.get_new_tasks())
         
         pprint(await service.get_active_stored_tasks())
+        await service.close()
     
 if __name__ == "__main__":
     asyncio.run(main())
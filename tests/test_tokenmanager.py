@@ -0,0 +1,103 @@
+"""
+A fresh login through the TokenManager, with the HSE auth servers mocked
+"""
+from datetime import datetime, timedelta
+from functools import partial
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import LMSAuther
+from model import Token
+from tokenmanager import TokenManager
+import httpx
+
+
+LOGIN_FORM = '<form id="loginForm" action="/adfs/oauth2/authorize?client-request-id=1"></form>'
+
+
+def auth_server(request: httpx.Request) -> httpx.Response:
+    if request.method == "POST":
+        expires = (datetime.utcnow() + timedelta(hours=8)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+        return httpx.Response(200, headers={"set-cookie": f"MSISAuth=msis; expires={expires}; path=/adfs"})
+
+    if "MSISAuth=msis" in request.headers.get("cookie", ""):
+        return httpx.Response(
+            302, headers={"location": "https://smartedu.hse.ru/auth#access_token=bearer&expires_in=3600"}
+        )
+
+    return httpx.Response(200, text=LOGIN_FORM)
+
+
+class FreshLoginTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(auth_server))
+        self.auther = LMSAuther(self.client)
+        self.stored: dict[str, Token] = {}
+
+        async def load(title: str) -> Token | None:
+            return None
+
+        async def store(token: Token):
+            self.stored[token.title] = token
+
+        async def refresh_bearer() -> Token | None:
+            msis = await self.manager.get("MSISAuth")
+            return await self.auther.get_bearer_token(msis) if msis is not None else None
+
+        self.manager = TokenManager(load, store)
+        self.manager.register(
+            "MSISAuth", partial(self.auther.get_msisauth_token, "user", "password")
+        )
+        self.manager.register("Bearer", refresh_bearer)
+
+    async def asyncTearDown(self):
+        self.manager.close()
+        await self.client.aclose()
+
+    async def test_fresh_login(self):
+        bearer = await self.manager.get("Bearer")
+
+        self.assertIsNotNone(bearer)
+        self.assertEqual(bearer.value, "bearer")
+        self.assertEqual(set(self.stored), {"MSISAuth", "Bearer"})
+
+        msis = self.stored["MSISAuth"]
+        self.assertIsNone(msis.expiration_dt.tzinfo)
+        self.assertGreater(msis.expiration_dt, datetime.now() + timedelta(hours=7))
+
+
+class StoredTokenTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_callers_share_the_load(self):
+        stored = Token(title="Bearer", value="db", expiration_dt=datetime.now() + timedelta(hours=1))
+        fetch_count = 0
+
+        async def load(title: str) -> Token | None:
+            await asyncio.sleep(0)
+            return stored
+
+        async def store(token: Token):
+            pass
+
+        async def fetch() -> Token | None:
+            nonlocal fetch_count
+            fetch_count += 1
+            return Token(title="Bearer", value="net", expiration_dt=datetime.now() + timedelta(hours=1))
+
+        manager = TokenManager(load, store)
+        manager.register("Bearer", fetch)
+
+        try:
+            tokens = await asyncio.gather(manager.get("Bearer"), manager.get("Bearer"))
+        finally:
+            manager.close()
+
+        self.assertEqual([token.value for token in tokens], ["db", "db"])
+        self.assertEqual(fetch_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+Keeping the auth tokens in memory and refreshing them before they expire
+"""
+from datetime import datetime
+from typing import Awaitable, Callable
+from model import Token
+import asyncio
+import logging
+import settings
+
+
+logger = logging.getLogger("token_manager")
+logger.setLevel(settings.LOG_LEVEL)
+
+TokenLoader = Callable[[str], Awaitable[Token | None]]
+TokenStorer = Callable[[Token], Awaitable[None]]
+TokenFetcher = Callable[[], Awaitable[Token | None]]
+
+
+class TokenManager:
+    """
+    Caches tokens by title. The database is only read the first time a token is needed
+    and written when a new token is gotten, so that the tokens survive restarts.
+
+    Tokens are refreshed in the background refresh_margin seconds before they expire,
+    concurrent callers wait for the same refresh instead of starting their own
+    """
+    def __init__(
+        self,
+        load: TokenLoader,
+        store: TokenStorer,
+        refresh_margin: float = settings.TOKEN_REFRESH_MARGIN_SECONDS,
+        retry_seconds: float = settings.TOKEN_REFRESH_RETRY_SECONDS,
+    ):
+        self.load = load
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.retry_seconds = retry_seconds
+        self.__fetchers: dict[str, TokenFetcher] = {}
+        self.__tokens: dict[str, Token] = {}
+        self.__loaded: set[str] = set()
+        self.__refreshes: dict[str, asyncio.Task] = {}
+        self.__timers: dict[str, asyncio.TimerHandle] = {}
+
+    def register(self, title: str, fetch: TokenFetcher):
+        """
+        fetch gets a new token from the auth servers, returns None if it can't
+        """
+        self.__fetchers[title] = fetch
+
+    @staticmethod
+    def __is_valid(token: Token | None) -> bool:
+        return token is not None and token.expiration_dt > datetime.now()
+
+    async def get(self, title: str) -> Token | None:
+        token = self.__tokens.get(title)
+        if self.__is_valid(token):
+            return token
+
+        logger.info(f"No valid {title} token, waiting for a new one.")
+        return await self.refresh(title)
+
+    async def refresh(self, title: str) -> Token | None:
+        """
+        Gets a new token (the first time, the stored one if it's still valid),
+        joins the refresh that's already going if there is one
+        """
+        refresh = self.__start_refresh(title)
+
+        # shielded so that a cancelled caller doesn't cancel the refresh for everyone else
+        return await asyncio.shield(refresh)
+
+    def __start_refresh(self, title: str) -> asyncio.Task:
+        refresh = self.__refreshes.get(title)
+
+        if refresh is None:
+            refresh = asyncio.create_task(self.__refresh(title))
+            self.__refreshes[title] = refresh
+            refresh.add_done_callback(lambda _: self.__refreshes.pop(title, None))
+
+        return refresh
+
+    async def __refresh(self, title: str) -> Token | None:
+        # loading in the refresh task so that the callers that come in meanwhile wait for the load too
+        if title not in self.__loaded:
+            self.__loaded.add(title)
+            logger.info(f"Loading {title} token from the database.")
+            token = await self.load(title)
+
+            if self.__is_valid(token):
+                self.__set_token(token)     # type: ignore
+                return token
+
+        logger.info(f"Refreshing {title} token.")
+
+        try:
+            token = await self.__fetchers[title]()
+        except Exception as e:
+            logger.exception(e)
+            token = None
+
+        if token is None:
+            logger.warning(f"Could not refresh {title} token.")
+
+            # still have some time before the old one expires
+            if self.__is_valid(self.__tokens.get(title)):
+                self.__schedule_refresh(title, self.retry_seconds)
+
+            return None
+
+        logger.info(f"{title} token refreshed, expires at {token.expiration_dt}.")
+        self.__set_token(token)
+
+        try:
+            await self.store(token)
+        except Exception as e:
+            # it's still good in memory, only a restart would need to get a new one
+            logger.exception(e)
+
+        return token
+
+    def __set_token(self, token: Token):
+        self.__tokens[token.title] = token
+
+        seconds_left = (token.expiration_dt - datetime.now()).total_seconds()
+        # short lived tokens are refreshed halfway through instead
+        delay = max(seconds_left - self.refresh_margin, seconds_left / 2)
+        self.__schedule_refresh(token.title, delay)
+
+    def __schedule_refresh(self, title: str, delay: float):
+        timer = self.__timers.pop(title, None)
+        if timer is not None:
+            timer.cancel()
+
+        def start_refresh():
+            self.__timers.pop(title, None)
+            self.__start_refresh(title)
+
+        self.__timers[title] = asyncio.get_running_loop().call_later(max(delay, 0), start_refresh)
+
+    def close(self):
+        for timer in self.__timers.values():
+            timer.cancel()
+
+        for refresh in self.__refreshes.values():
+            refresh.cancel()
+
+        self.__timers.clear()
+        self.__refreshes.clear()
@@ -1,5 +1,6 @@
 import asyncio
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import AsyncIterator
 from model import User
 # import sqlite3
 import aiosqlite
@@ -21,11 +22,30 @@ class UserService:
         async with self.connection.cursor() as cursor:
             await cursor.execute(
                 """--sql
-                    INSERT OR IGNORE INTO users(id, is_active, remind_interval)
-                    VALUES (?, ?, ?);
+                    INSERT OR IGNORE INTO users(id, is_active, remind_interval, digest_mode)
+                    VALUES (?, ?, ?, ?);
                 """,
                 user.encode()
             )
+            # new users get every section
+            await cursor.executemany(
+                """--sql
+                    INSERT OR IGNORE INTO subscriptions(user_id, section_id)
+                    VALUES (?, ?);
+                """,
+                ((user_id, section_id) for _, section_id, _ in settings.COURSE_SECTIONS)
+            )
+            # reminder rows are created eagerly so that the reminder queries don't need outer joins
+            await cursor.execute(
+                """--sql
+                    INSERT OR IGNORE INTO reminders(task_id, user_id)
+                    SELECT id, ? FROM lmstasks
+                    WHERE deadline > ? AND section_id IN (
+                        SELECT section_id FROM subscriptions WHERE user_id = ?
+                    );
+                """,
+                (user_id, datetime.now().timestamp(), user_id)
+            )
         
         await self.connection.commit()
         
@@ -41,7 +61,7 @@ class UserService:
         async with self.connection.cursor() as cursor:
             await cursor.execute(
                 """--sql
-                    SELECT id, is_active, remind_interval FROM users WHERE id = ?;
+                    SELECT id, is_active, remind_interval, digest_mode FROM users WHERE id = ?;
                 """,
                 (user_id, )
             )
@@ -69,28 +89,97 @@ class UserService:
         async with self.connection.cursor() as cursor: 
             await cursor.execute(
                 """--sql
-                    REPLACE INTO users(id, is_active, remind_interval)
-                    VALUES (?, ?, ?);
+                    REPLACE INTO users(id, is_active, remind_interval, digest_mode)
+                    VALUES (?, ?, ?, ?);
                 """,
                 user.encode()
             )
         
         await self.connection.commit()
 
+    async def get_subscriptions(self, user_id: int) -> set[int]:
+        """
+        Gets the ids of the sections the user is subscribed to
+        """
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    SELECT section_id FROM subscriptions WHERE user_id = ?;
+                """,
+                (user_id, )
+            )
+            result = await cursor.fetchall()
+        
+        return {section_id for section_id, in result}
+    
+    async def subscribe(self, user_id: int, section_id: int):
+        logger.info(f"Subscribing user {user_id} to section {section_id}")
+        
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    INSERT OR IGNORE INTO subscriptions(user_id, section_id)
+                    VALUES (?, ?);
+                """,
+                (user_id, section_id)
+            )
+            await cursor.execute(
+                """--sql
+                    INSERT OR IGNORE INTO reminders(task_id, user_id)
+                    SELECT id, ? FROM lmstasks
+                    WHERE section_id = ? AND deadline > ?;
+                """,
+                (user_id, section_id, datetime.now().timestamp())
+            )
+        
+        await self.connection.commit()
+    
+    async def unsubscribe(self, user_id: int, section_id: int):
+        logger.info(f"Unsubscribing user {user_id} from section {section_id}")
+        
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(
+                """--sql
+                    DELETE FROM subscriptions
+                    WHERE user_id = ? AND section_id = ?;
+                """,
+                (user_id, section_id)
+            )
+            # the reminders only exist for the subscribed sections
+            await cursor.execute(
+                """--sql
+                    DELETE FROM reminders
+                    WHERE user_id = ? AND task_id IN (
+                        SELECT id FROM lmstasks WHERE section_id = ?
+                    );
+                """,
+                (user_id, section_id)
+            )
+        
+        await self.connection.commit()
+
     async def get_active_users(self) -> list[User]:
         logger.debug("Getting the list of active users")
+        
+        return [user async for user in self.iter_active_users()]
+    
+    async def iter_active_users(self, page_size: int = settings.DB_FETCH_PAGE_SIZE) -> AsyncIterator[User]:
+        """
+        Streams the active users from the database page by page,
+        so that only one page of them is in memory at a time
+        """
         async with self.connection.cursor() as cursor:
             await cursor.execute(
                 """--sql
-                    SELECT id, is_active, remind_interval
+                    SELECT id, is_active, remind_interval, digest_mode
                     FROM users
                     WHERE is_active = 1;
                 """
             )
         
-            users_raw = await cursor.fetchall()
-        
-        return [User.decode(*user_data) for user_data in users_raw]
+            while users_raw := await cursor.fetchmany(page_size):
+                for user_data in users_raw:
+                    yield User.decode(*user_data)
 
 async def main():
     logging.basicConfig(
@@ -0,0 +1,150 @@
+"""
+Benchmarking how fast the bot handles commands coming in through the webhook.
+
+Runs the webhook app of a BotService on a temporary database with a fake Bot API server
+that answers every method, then POSTs synthetic command updates at it:
+
+    python webhookbench.py [update count] [concurrent senders] [user count]
+"""
+from datetime import datetime
+from time import perf_counter
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import web
+from bot import BotService
+import aiohttp
+import aiosqlite
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import settings
+import create_tables
+
+
+TOKEN = "123456:BENCHMARKabcdefghijklmnopqrstuvwxyz"
+COMMANDS = ("/help", "/start", "/sections", "/digest on", "/digest off", "/set_remind_interval 2 days")
+
+
+class FakeBotAPI:
+    """
+    Answers every Bot API method successfully without doing anything, counts the calls
+    """
+    def __init__(self):
+        self.calls: dict[str, int] = {}
+        self.__message_ids = itertools.count(1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+
+        if method == "sendMessage":
+            result = {
+                "message_id": next(self.__message_ids),
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+
+        return app
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    command_length = len(text.split()[0])
+
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": command_length}],
+        },
+    }
+
+
+async def start_site(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    host, port = site._server.sockets[0].getsockname()[:2]     # type: ignore
+
+    return runner, f"http://{host}:{port}"
+
+
+async def benchmark(update_count: int, sender_count: int, user_count: int):
+    create_tables.main()
+    fake_api = FakeBotAPI()
+    api_runner, api_url = await start_site(fake_api.create_app())
+
+    async with aiosqlite.connect(settings.DB_PATH) as connection:
+        service = BotService(connection, TOKEN, api_server=TelegramAPIServer.from_base(api_url))
+        webhook_runner, webhook_url = await start_site(service.create_webhook_app())
+
+        updates = (
+            make_update(update_id, 1000 + update_id % user_count, COMMANDS[update_id % len(COMMANDS)])
+            for update_id in range(update_count)
+        )
+        latencies: list[float] = []
+        failed_count = 0
+
+        async def sender(session: aiohttp.ClientSession):
+            nonlocal failed_count
+
+            for update in updates:
+                start = perf_counter()
+                async with session.post(webhook_url + settings.WEBHOOK_PATH, json=update) as response:
+                    await response.read()
+
+                latencies.append(perf_counter() - start)
+                failed_count += response.status != 200
+
+        start = perf_counter()
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(sender(session) for _ in range(sender_count)))
+        total_seconds = perf_counter() - start
+
+        await webhook_runner.cleanup()
+        await service.close()
+
+    await api_runner.cleanup()
+
+    latencies.sort()
+    print(
+        f"{update_count} updates from {sender_count} senders "
+        f"(max {settings.WEBHOOK_MAX_CONCURRENT_UPDATES} handled at a time) "
+        f"in {total_seconds:.2f} s: {update_count / total_seconds:.0f} updates/s"
+    )
+    print(
+        f"latency: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, "
+        f"max {latencies[-1] * 1000:.1f} ms"
+    )
+    print(f"failed: {failed_count}, bot api calls: {fake_api.calls}")
+
+
+def main():
+    update_count, sender_count, user_count = (
+        int(arg) for arg in (sys.argv[1:] + ["2000", "50", "200"][len(sys.argv) - 1:])
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings.DB_PATH = os.path.join(directory, "bench.db")
+        asyncio.run(benchmark(update_count, sender_count, user_count))
+
+
+if __name__ == "__main__":
+    main()